@@ -3,8 +3,13 @@
 # Load up numpy and have it read the samples
 import numpy as np
 with open('held_start_ch9_4msps.iq', 'rb') as iq_file:
-    samples = np.fromfile(iq_file, dtype=np.int8) / 128.
-samples = samples[0::2] + samples[1::2]*1j # Every other byte is imaginary
+    samples = np.fromfile(iq_file, dtype=np.int8)
+
+# Scale the bytes to the -1..1 range as single-precision floats, all in one
+# pass. Every other byte is imaginary, and as it happens, numpy stores its
+# complex64 numbers the same way (as a pair of float32s: real, then imaginary),
+# so we can just look at the floats as complex numbers without copying them.
+samples = np.multiply(samples, np.float32(1/128.), dtype=np.float32).view(np.complex64)
 
 # Remove the "DC spike" - the small offset from zero due to charges on the
 # HackRF's ADC. This is easy: it's the only nonperiodic component in the
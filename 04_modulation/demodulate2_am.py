@@ -3,8 +3,8 @@
 # Stuff from last time
 import numpy as np
 with open('held_start_ch9_4msps.iq', 'rb') as iq_file:
-    samples = np.fromfile(iq_file, dtype=np.int8) / 128.
-samples = samples[0::2] + samples[1::2]*1j
+    samples = np.fromfile(iq_file, dtype=np.int8)
+samples = np.multiply(samples, np.float32(1/128.), dtype=np.float32).view(np.complex64)
 
 dc_spike = np.mean(samples)
 samples -= dc_spike
@@ -18,7 +18,7 @@ samples = samples[2000000:]
 
 # We need a more reliable indicator of signal level. Let's smooth out the
 # amplitude to remove noise spikes so we can just use that.
-window = np.hanning(30) # This generates a 30-sample-wide gently-sloping window function
+window = np.hanning(30).astype(np.float32) # This generates a 30-sample-wide gently-sloping window function
 window /= np.sum(window) # This "normalizes" it (so it sums to 1)
 # Finally, this sweeps it across the samples, sorta performing a per-sample
 # weighted average with each of its 30 nearest neighbors
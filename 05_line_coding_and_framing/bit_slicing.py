@@ -0,0 +1,150 @@
+# Turning a burst's correlation with the chipping sequence into bits.
+#
+# The original loop in decode_wavebird.py looked at a small window of the
+# correlation, took the strongest peak in it as a bit, then sliced the
+# correlation array to jump ahead to the next window and appended the bit to a
+# string. That works, but it reallocates the string and makes a new array
+# slice for every single bit, and it assumes the bits are always the same
+# whole number of samples apart.
+#
+# Instead, we keep track of where each bit should be and follow the peaks from
+# one bit to the next, for all of the bursts at once (see recover_bits()).
+
+import numpy as np
+
+def bits_to_str(bits):
+    """
+    Format an array of 0/1 bits as a string of '0's and '1's
+    """
+    return (bits + ord('0')).astype(np.uint8).tobytes().decode('ascii')
+
+def recover_bits(correlations, first_bits, samples_per_bit, samples_per_chip,
+                 acquire=(0.7, 0.2), track=(0.3, 0.05), acquire_bits=16,
+                 max_drift=0.1):
+    """
+    Find the middle of every bit in each of the 'correlations', starting with
+    the ones at 'first_bits', and return a list of the correlation there (one
+    float32 array per correlation; the sign is the bit, and the size is how
+    sure we are of it)
+
+    Rather than looking for every peak from scratch, and assuming the bits are
+    always about the same whole number of samples apart, we keep track of
+    where we think the bits are, and nudge that along with every bit we see
+    (a "timing recovery loop"): the bits can be any (fractional) number of
+    samples apart, and if the transmitter's clock runs a little fast or slow,
+    we follow it (but never by more than 'max_drift', as a fraction of
+    'samples_per_bit', so noise can't run away with it).
+
+    To tell whether we're early or late, we find the peak within a chip either
+    side of where we expected the bit, down to a fraction of a sample (by
+    fitting a parabola through the highest sample and its neighbors). Then we
+    correct for some of the difference right away, and let some of it change
+    our idea of how far apart the bits are. For the first 'acquire_bits' bits,
+    we do that by a lot (the 'acquire' pair of fractions), to lock on quickly;
+    after that we only do it by a little ('track'), so the noise doesn't throw
+    us off.
+
+    All of the correlations are worked through together, one bit at a time.
+    """
+
+    count = len(correlations)
+    if not count:
+        return []
+
+    # Line everything up in one 2D array, padding with zeros
+    lengths = np.array([len(correlation) for correlation in correlations])
+    padded = np.zeros((count, lengths.max() + 2*samples_per_chip + 2),
+                      dtype=np.float32)
+    for row, correlation in zip(padded, correlations):
+        row[:len(correlation)] = correlation
+    strength = np.abs(padded)
+    rows = np.arange(count)
+    around = np.arange(-samples_per_chip, samples_per_chip + 1)
+
+    position = np.array(first_bits, dtype=float)
+    spacing = np.full(count, float(samples_per_bit))
+    min_spacing = samples_per_bit * (1 - max_drift)
+    max_spacing = samples_per_bit * (1 + max_drift)
+
+    # (with the bits never closer than 'min_spacing', this is as many as there
+    # can be)
+    values = []
+    counts = np.zeros(count, dtype=int)
+    for _ in range(int(lengths.max() / min_spacing) + 1):
+        active = position < lengths
+        if not active.any():
+            break
+        counts += active
+        gain, rate_gain = acquire if len(values) < acquire_bits else track
+
+        # The strongest sample near where we expected the bit...
+        nearest = np.round(position).astype(int)
+        indices = np.clip(nearest[:, np.newaxis] + around, 0,
+                          padded.shape[1] - 1)
+        nearby = strength[rows[:, np.newaxis], indices]
+        strongest = np.clip(np.argmax(nearby, axis=1), 1, len(around) - 2)
+
+        # ...and where the peak really is, between it and its neighbors
+        before, peak, after = (nearby[rows, strongest - 1],
+                               nearby[rows, strongest],
+                               nearby[rows, strongest + 1])
+        curve = before - 2*peak + after
+        shift = np.where(curve < 0,
+                         0.5*(before - after) / np.minimum(curve, -1e-6), 0)
+        error = (around[strongest] + np.clip(shift, -0.5, 0.5) +
+                 nearest - position)
+
+        # Read off the bit (in between samples, if that's where it is)
+        position += gain * error
+        index = np.clip(position.astype(int), 0, padded.shape[1] - 2)
+        fraction = (position - index).astype(np.float32)
+        values.append(padded[rows, index]*(1 - fraction) +
+                      padded[rows, index + 1]*fraction)
+
+        spacing = np.clip(spacing + rate_gain * error,
+                          min_spacing, max_spacing)
+        position += spacing
+
+    values = np.array(values).T
+    return [row[:n] for row, n in zip(values, counts)]
+
+def soft_bits(values):
+    """
+    Turn the correlation 'values' at each bit (as returned by recover_bits())
+    into an int8 array of "soft" bits
+
+    The sign is the bit (positive for 1, negative for 0), and the size is how
+    sure we are of it, scaled so that an average bit in this frame comes out
+    at 32 (and the surest ones max out at 127). A bit that's close to 0 is one
+    that might well be wrong, which is just what error correction wants to
+    know (see chapter 6).
+    """
+    scale = 32 / max(np.mean(np.abs(values)), 1e-6)
+    return np.clip(np.round(values * scale), -127, 127).astype(np.int8)
+
+# Soft bits are written out as one record per frame: the number of bits, as a
+# little-endian uint16, then that many int8 soft bits.
+SOFT_LENGTH = np.dtype('<u2')
+
+def write_soft(output, soft):
+    """
+    Append the soft bits 'soft' (one frame's worth) to the binary file 'output'
+    """
+    output.write(np.array([len(soft)], dtype=SOFT_LENGTH).tobytes())
+    output.write(soft.astype(np.int8).tobytes())
+
+def read_soft(filename):
+    """
+    Read back every frame written to 'filename' by write_soft(), returning a
+    list of int8 arrays
+    """
+    data = np.fromfile(filename, dtype=np.uint8)
+
+    frames = []
+    position = 0
+    while position < len(data):
+        length = int(data[position:position + 2].view(SOFT_LENGTH)[0])
+        position += 2
+        frames.append(data[position:position + length].view(np.int8))
+        position += length
+    return frames
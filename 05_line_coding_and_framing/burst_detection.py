@@ -0,0 +1,280 @@
+# In chapter 4 we found bursts by looking at the whole capture at once: the
+# DC spike, the signal and noise levels, and the hysteresis thresholds were all
+# worked out from every sample in the file before we looked for a single burst.
+# That's simple, but it means the whole capture has to be in memory, and it
+# can't work at all on a live stream from the radio.
+#
+# The BurstDetector here does the same job one block at a time. Everything that
+# used to be computed over the whole capture is instead a running estimate that
+# gets updated with every block, and anything that straddles the end of a block
+# (the smoothing window, the hysteresis state, or a burst that's only half
+# arrived) gets carried over to the next one.
+
+import numpy as np
+
+from iq_files import FORMATS
+from fm_demod import Int8Tables
+
+def hyst(x, th_lo, th_hi, initial = False):
+    """
+    Analyze 'x' and return False where it's below th_lo,
+    True where it's above th_hi, and the previous value if between.
+
+    From https://stackoverflow.com/questions/23289976/how-to-find-zero-crossings-with-hysteresis
+    """
+    hi = x >= th_hi
+    lo_or_hi = (x <= th_lo) | hi
+    ind = np.nonzero(lo_or_hi)[0]
+    if not ind.size: # prevent index error if ind is empty
+        return np.zeros_like(x, dtype=bool) | initial
+    cnt = np.cumsum(lo_or_hi) # from 0 to len(x)
+    return np.where(cnt, hi[ind[cnt-1]], initial)
+
+def find_runs(is_signal):
+    """
+    Find every run of True in the boolean array 'is_signal', returning two
+    arrays: the index where each run starts, and the index just past its end
+
+    This used to be done with itertools.groupby(), which is nice and readable
+    but has to go through Python for every single sample. Instead, we look for
+    the places where 'is_signal' changes from one sample to the next: padding
+    it with False on both ends means the changes always come in pairs, the
+    first of each pair being a start and the second a stop.
+    """
+    padded = np.concatenate([[False], is_signal, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
+
+def filter_runs(starts, stops, min_length=8000, max_length=12000):
+    """
+    Return a (N, 2) array of the (start, stop) indices of the runs (as found by
+    find_runs()) that are the right length to be a burst
+    """
+    lengths = stops - starts
+    keep = (min_length < lengths) & (lengths < max_length)
+    return np.column_stack([starts[keep], stops[keep]])
+
+def burst_spans(is_signal, min_length=8000, max_length=12000):
+    """
+    Return a (N, 2) array of the (start, stop) indices of every run of True in
+    'is_signal' that's the right length to be a burst
+
+    Slicing the samples with these gives views, not copies.
+    """
+    starts, stops = find_runs(is_signal)
+    return filter_runs(starts, stops, min_length, max_length)
+
+class BurstDetector(object):
+    """
+    Find bursts in a stream of samples that arrives one block at a time
+
+    Call feed() with each block as it comes in, and flush() once the stream
+    ends; both return a list of (start, burst) pairs, where 'start' is the
+    index of the burst's first sample counting from the start of the stream,
+    and 'burst' is its (DC-removed) samples.
+    """
+
+    def __init__(self, min_length=8000, max_length=12000, window_size=30):
+        self.min_length = min_length
+        self.max_length = max_length
+
+        self.window = np.hanning(window_size).astype(np.float32)
+        self.window /= np.sum(self.window)
+
+        # np.convolve(..., mode='same') centers the window, so the level of
+        # each sample depends on this many samples after it. We have to hold
+        # those samples back until the next block shows up.
+        self.lookahead = (window_size - 1)//2
+        self.delayed = None
+        # ...and the magnitudes of the ones before it, which we keep around
+        # from the end of the previous block (zeros at first, the same as the
+        # padding np.convolve would use)
+        self.magnitudes = np.zeros(window_size - 1, dtype=np.float32)
+
+        # Index (in the stream) of the first sample in 'delayed'
+        self.position = 0
+
+        # Running totals for the DC spike and signal/noise level estimates
+        self.dc_sum = 0
+        self.dc_count = 0
+        self.level_sum = 0.
+        self.level_count = 0
+        self.signal_sum = 0.
+        self.signal_count = 0
+        self.noise_sum = 0.
+        self.noise_count = 0
+
+        # Hysteresis state at the end of the last block
+        self.is_signal = False
+
+        # The burst that's still in progress at the end of the last block
+        self.burst_start = None
+        self.burst_length = 0
+        self.burst_pieces = []
+
+    def feed(self, samples):
+        """
+        Process the next block of 'samples' and return any bursts that ended
+        in it
+        """
+
+        samples, magnitudes = self._remove_dc(samples)
+
+        magnitudes = np.concatenate([self.magnitudes, magnitudes])
+        self.magnitudes = magnitudes[len(magnitudes)-len(self.magnitudes):]
+
+        if self.delayed is None:
+            self.delayed = samples[:0]
+        samples = np.concatenate([self.delayed, samples])
+        level = np.convolve(magnitudes, self.window, mode='valid')
+
+        # Only the samples with a complete window have a level yet
+        ready = max(len(samples) - self.lookahead, 0)
+        self.delayed = samples[ready:]
+        return self._process(samples[:ready], level[len(level)-ready:])
+
+    @property
+    def dc(self):
+        """
+        The current estimate of the DC spike
+        """
+        return self.dc_sum/self.dc_count if self.dc_count else 0j
+
+    def _remove_dc(self, samples):
+        # DC spike: the mean of everything we've seen so far
+        self.dc_sum += complex(np.sum(samples, dtype=complex))
+        self.dc_count += len(samples)
+        samples = samples - self.dc
+
+        return samples, np.abs(samples)
+
+    def flush(self):
+        """
+        Process whatever is left at the end of the stream, returning any final
+        bursts
+        """
+
+        # Pad the end with zeros, like np.convolve(..., mode='same') would
+        padding = np.zeros(self.lookahead, dtype=np.float32)
+        magnitudes = np.concatenate([self.magnitudes, padding])
+        level = np.convolve(magnitudes, self.window, mode='valid')
+
+        if self.delayed is None:
+            return [] # Never got any samples at all
+        samples, self.delayed = self.delayed, self.delayed[:0]
+        bursts = self._process(samples, level[len(level)-len(samples):])
+
+        # The stream ending also ends whatever burst was in progress
+        if self.burst_start is not None:
+            bursts.extend(self._end_burst())
+
+        return bursts
+
+    def _process(self, samples, level):
+        if not len(samples):
+            return []
+
+        # Update the running mean, and sort the levels above and below it into
+        # signal and noise
+        self.level_sum += np.sum(level, dtype=float)
+        self.level_count += len(level)
+        mean = self.level_sum/self.level_count
+        self.signal_sum += np.sum(level[level>mean], dtype=float)
+        self.signal_count += np.count_nonzero(level>mean)
+        self.noise_sum += np.sum(level[level<mean], dtype=float)
+        self.noise_count += np.count_nonzero(level<mean)
+
+        if self.signal_count and self.noise_count:
+            signal_level = self.signal_sum/self.signal_count
+            noise_level = self.noise_sum/self.noise_count
+            signal_threshold = 0.75*signal_level + 0.25*noise_level
+            noise_threshold = 0.75*noise_level + 0.25*signal_level
+
+            is_signal = hyst(level, noise_threshold, signal_threshold,
+                             self.is_signal)
+        else:
+            # Nothing but a flat line so far; can't tell signal from noise
+            is_signal = np.zeros(len(level), dtype=bool)
+        self.is_signal = is_signal[-1]
+
+        bursts = []
+        starts, stops = find_runs(is_signal)
+
+        # Did the burst in progress at the end of the last block carry on into
+        # this one?
+        if self.burst_start is not None:
+            if len(starts) and starts[0] == 0:
+                self._extend_burst(samples[:stops[0]], self.position)
+                if stops[0] < len(samples):
+                    bursts.extend(self._end_burst())
+                starts, stops = starts[1:], stops[1:]
+            else:
+                bursts.extend(self._end_burst())
+
+        # Is there one that hasn't finished by the end of this block?
+        if len(stops) and stops[-1] == len(samples):
+            self._extend_burst(samples[starts[-1]:], self.position + starts[-1])
+            starts, stops = starts[:-1], stops[:-1]
+
+        # If so, its piece from this block has to outlive the block
+        if self.is_signal and self.burst_pieces:
+            self.burst_pieces[-1] = np.array(self.burst_pieces[-1])
+
+        # Everything else starts and ends right here, so no copying needed
+        for start, stop in filter_runs(starts, stops, self.min_length,
+                                       self.max_length):
+            bursts.append((self.position + start, samples[start:stop]))
+
+        self.position += len(samples)
+        return bursts
+
+    def _extend_burst(self, samples, start):
+        if self.burst_start is None:
+            self.burst_start = start
+
+        self.burst_length += len(samples)
+        if self.burst_length < self.max_length:
+            self.burst_pieces.append(samples)
+        else:
+            self.burst_pieces = [] # Too long already; no need to keep it
+
+    def _end_burst(self):
+        start, length, pieces = (self.burst_start, self.burst_length,
+                                 self.burst_pieces)
+        self.burst_start = None
+        self.burst_length = 0
+        self.burst_pieces = []
+
+        if not self.min_length < length < self.max_length:
+            return [] # Ignore bursts of wrong length
+
+        burst = pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+        return [(start, burst)]
+
+class RawBurstDetector(BurstDetector):
+    """
+    A BurstDetector for raw 8-bit samples, as given by
+    Capture.chunks(..., raw=True), in the given 'format'
+
+    The samples are never converted to complex numbers: their magnitudes come
+    from lookup tables instead (see fm_demod.Int8Tables), and the bursts are
+    handed back still raw. The DC spike isn't subtracted from the samples
+    themselves, but it is taken out of the tables, which are rebuilt with the
+    latest estimate for every block; 'tables' always has the current ones.
+    """
+
+    def __init__(self, min_length=8000, max_length=12000, window_size=30,
+                 format='cs8'):
+        BurstDetector.__init__(self, min_length, max_length, window_size)
+        self.format = format
+        self.tables = Int8Tables(format=format)
+
+    def _remove_dc(self, samples):
+        dtype, zero, scale = FORMATS[self.format]
+        iq = samples.view(dtype).reshape(-1, 2)
+        i, q = np.sum(iq, axis=0, dtype=np.int64)
+        self.dc_sum += complex(i - zero*len(iq), q - zero*len(iq)) / scale
+        self.dc_count += len(samples)
+        self.tables = Int8Tables(self.dc, self.format)
+
+        return samples, self.tables.magnitude[samples]
@@ -0,0 +1,157 @@
+# Splitting a wideband capture into WaveBird channels.
+#
+# A WaveBird only uses about 2 MHz of spectrum, but a radio like the HackRF can
+# record 20 MHz at once, which covers several channels. To decode all of them,
+# we need to pull each channel out on its own: shift it down so it's centered on
+# 0 Hz (where the rest of the decoder expects it), filter away everything else,
+# and drop the sample rate down to something that just fits one channel.
+#
+# Doing that separately for every channel would mean a frequency shift, a long
+# filter and a resampler per channel, all running at the full input rate. But
+# in the frequency domain, all three are trivial: after an FFT, each channel is
+# just a range of bins. Picking out that range and inverse-FFTing it (with a
+# smaller FFT) gives us the channel, already at baseband and already at a lower
+# sample rate, and multiplying the bins by a filter response on the way is the
+# filter. The one big FFT is shared by every channel.
+#
+# Like matched_filter.py, this works on overlapping blocks ("overlap-save"),
+# throwing away the edges of every block, which the FFT's wrap-around spoils.
+
+from __future__ import division
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# The 16 WaveBird channels and their center frequencies (in Hz), from chapter 7
+CHANNELS = {
+    1: 2479.2e6,
+    2: 2474.4e6,
+    3: 2404.8e6,
+    4: 2409.6e6,
+    5: 2419.2e6,
+    6: 2414.4e6,
+    7: 2424.0e6,
+    8: 2428.8e6,
+    9: 2438.4e6,
+    10: 2433.6e6,
+    11: 2445.6e6,
+    12: 2450.4e6,
+    13: 2460.0e6,
+    14: 2455.2e6,
+    15: 2464.8e6,
+    16: 2469.6e6,
+}
+
+class Channelizer(object):
+    """
+    Split a wideband stream of complex samples into one baseband stream per
+    channel, one block at a time
+
+    'sample_rate' and 'center_frequency' describe the input, and 'frequencies'
+    maps each channel to its center frequency (all in Hz). Only the channels
+    that fit entirely inside the captured bandwidth are kept; 'channels' lists
+    them, in order.
+
+    Each output keeps the 'bandwidth' around its channel, fading out over
+    another 'transition' on either side, and is sampled at 'output_rate'.
+    """
+
+    def __init__(self, sample_rate, center_frequency, frequencies=CHANNELS,
+                 bandwidth=3e6, transition=0.5e6):
+        # Bins of about 5 kHz are fine enough to place every channel well
+        fft_size = 256
+        while sample_rate / fft_size > 5000:
+            fft_size *= 2
+        self.fft_size = fft_size
+        self.sample_rate = sample_rate
+        bin_width = sample_rate / fft_size
+
+        # Each channel is cut out of the spectrum with a smaller FFT that's just
+        # big enough for it
+        edge = bandwidth/2 + transition
+        self.output_size = 16
+        while self.output_size * bin_width < 2*edge:
+            self.output_size *= 2
+        self.output_size = min(self.output_size, fft_size)
+        self.decimation = fft_size // self.output_size
+        self.output_rate = sample_rate / self.decimation
+
+        # A quarter of each block overlaps with the blocks on either side, half
+        # at each end
+        self.overlap = fft_size // 4
+        self.hop = fft_size - self.overlap
+        self.keep = slice(self.overlap//2 // self.decimation,
+                          (fft_size - self.overlap//2) // self.decimation)
+
+        # The bins for each channel, in the order the smaller inverse FFT wants
+        # them (0 Hz first, then the positive frequencies, then the negative)
+        offsets = np.fft.fftfreq(self.output_size, 1/self.output_size).astype(int)
+        frequency = offsets * bin_width
+        response = np.clip((edge - np.abs(frequency)) / transition, 0, 1)
+        response = 0.5 - 0.5*np.cos(np.pi*response) # Smooth it out
+        # (numpy's inverse FFT divides by its size, which is smaller than the
+        # forward FFT's; this keeps the samples at the same level)
+        self.response = (response * self.output_size/fft_size).astype(np.complex64)
+
+        self.channels = []
+        self.bins = []
+        self.shifts = []
+        for channel, channel_frequency in sorted(frequencies.items()):
+            offset = channel_frequency - center_frequency
+            if abs(offset) + edge > sample_rate/2:
+                continue # Not (entirely) in this capture
+
+            # Whatever's left after rounding the channel to the nearest bin is
+            # shifted out with a slow rotation afterwards
+            center = int(round(offset / bin_width))
+            self.channels.append(channel)
+            self.bins.append((center + offsets) % fft_size)
+            self.shifts.append((center, (offset - center*bin_width) /
+                                        self.output_rate))
+
+        # Start with half an overlap of silence, so the first output sample
+        # lines up with the first input sample
+        self.history = np.zeros(self.overlap//2, dtype=np.complex64)
+        self.blocks = 0
+
+    def process(self, samples):
+        """
+        Channelize the next block of 'samples', returning a list of the output
+        samples that are ready for each of the 'channels'
+        """
+
+        buffered = np.concatenate([self.history, samples.astype(np.complex64)])
+        blocks = max((len(buffered) - self.overlap) // self.hop, 0)
+        self.history = buffered[blocks*self.hop:]
+        if not blocks:
+            return [np.zeros(0, dtype=np.complex64) for _ in self.channels]
+
+        # All of the blocks go through the big FFT together
+        stride = buffered.strides[0]
+        windows = as_strided(buffered, shape=(blocks, self.fft_size),
+                             strides=(self.hop*stride, stride))
+        spectra = np.fft.fft(windows, axis=1).astype(np.complex64)
+
+        block_numbers = self.blocks + np.arange(blocks)
+        output_numbers = (self.blocks*self.hop // self.decimation +
+                          np.arange(blocks * (self.keep.stop - self.keep.start)))
+        self.blocks += blocks
+
+        outputs = []
+        for bins, (center, residual) in zip(self.bins, self.shifts):
+            channel = np.fft.ifft(spectra[:, bins] * self.response, axis=1)
+            channel = channel[:, self.keep]
+
+            # Each block's inverse FFT puts its own first sample at time zero,
+            # so the shift down to baseband restarts at every block. Turn each
+            # block by however far the shift should have gotten by then.
+            starts = block_numbers*self.hop - self.overlap//2
+            turns = (center * starts % self.fft_size) / self.fft_size
+            channel *= np.exp(-2j*np.pi*turns)[:, np.newaxis]
+            channel = channel.ravel()
+
+            if residual:
+                channel *= np.exp(-2j*np.pi*(residual*output_numbers % 1))
+            outputs.append(channel.astype(np.complex64))
+
+        return outputs
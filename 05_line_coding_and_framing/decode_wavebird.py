@@ -1,99 +1,226 @@
 #!/usr/bin/env python
 
+# Make Python 2's a/b act like Python 3's.
+from __future__ import division
+
 # Stuff copied over from chapter 4
-import sys # This time we take the filename on the command line
+import argparse # This time we take the filename on the command line
 import numpy as np
-with open(sys.argv[1], 'rb') as iq_file:
-    samples = np.fromfile(iq_file, dtype=np.int8) / 128.
-samples = samples[0::2] + samples[1::2]*1j
-
-dc_spike = np.mean(samples)
-samples -= dc_spike
-
-window = np.hanning(30)
-window /= np.sum(window)
-level = np.convolve(np.abs(samples), window, mode='same')
-mean = level.mean()
-signal_level = level[level>mean].mean()
-noise_level = level[level<mean].mean()
-signal_threshold = 0.75*signal_level + 0.25*noise_level
-noise_threshold = 0.75*noise_level + 0.25*signal_level
-
-# We're going to chunk apart *all* bursts, not just one from the middle
-def hyst(x, th_lo, th_hi, initial = False):
-    """
-    Analyze 'x' and return False where it's below th_lo,
-    True where it's above th_hi, and the previous value if between.
 
-    From https://stackoverflow.com/questions/23289976/how-to-find-zero-crossings-with-hysteresis
-    """
-    hi = x >= th_hi
-    lo_or_hi = (x <= th_lo) | hi
-    ind = np.nonzero(lo_or_hi)[0]
-    if not ind.size: # prevent index error if ind is empty
-        return np.zeros_like(x, dtype=bool) | initial
-    cnt = np.cumsum(lo_or_hi) # from 0 to len(x)
-    return np.where(cnt, hi[ind[cnt-1]], initial)
-
-is_signal = hyst(level, noise_threshold, signal_threshold)
-
-import itertools
-i = 0
-bursts = []
-for signal,grouper in itertools.groupby(is_signal):
-    run_length = len(list(grouper))
-    i += run_length
-
-    if signal:
-        if 8000 < run_length < 12000: # Ignore bursts of wrong length
-            bursts.append(samples[i-run_length:i])
+# Unlike chapter 4, we don't read the whole capture at once: a long recording
+# won't fit in memory. We walk through it a chunk at a time instead (see
+# iq_files.py for how that works, and for the other kinds of capture file we
+# can read), and hand each chunk to a BurstDetector, which keeps track of
+# everything it needs to know from the chunks before it (see
+# burst_detection.py).
+from iq_files import Capture, FORMATS
+from burst_detection import BurstDetector, RawBurstDetector
+from resampling import Resampler
+from channelizer import Channelizer
+from fm_demod import fm_demodulate_many, remove_carrier_offsets
+from matched_filter import MatchedFilter
+from sync_search import find_preambles
+from bit_slicing import recover_bits, bits_to_str, soft_bits, write_soft
+from frame_records import write_header, make_record, write_record
+
+parser = argparse.ArgumentParser(description='Decode WaveBird messages from a .iq capture')
+parser.add_argument('iq_file', help='I/Q capture (.iq, .cu8, .cs16, .cf32, SigMF...), or - for standard input')
+parser.add_argument('--format', choices=sorted(FORMATS),
+                    help='Sample format (default: guessed from the file name, or cs8 for HackRF-style files)')
+parser.add_argument('--rate', type=float,
+                    help='Sample rate in samples/sec (default: from SigMF metadata, or 4000000)')
+parser.add_argument('--samples-per-chip', type=int, default=3,
+                    help='Resample to this many samples per chip before decoding (default: 3)')
+parser.add_argument('--lookup', default=False, action='store_true',
+                    help='FM-demodulate using lookup tables instead of complex math (faster; 8-bit formats only)')
+parser.add_argument('--sync-score', type=float, default=0.8,
+                    help='Only decode bursts that start with a WaveBird preamble matching at least this well, from -1 to 1 (default: 0.8)')
+parser.add_argument('--soft', metavar='FILE',
+                    help='Also write the soft bits (how sure we are of each bit) of every frame to FILE (see bit_slicing.py)')
+parser.add_argument('--frames', metavar='FILE',
+                    help='Also write every frame to FILE as a compact binary record (see frame_records.py)')
+parser.add_argument('--channelize', default=False, action='store_true',
+                    help='Decode every WaveBird channel in a wideband capture, not just the one in the middle')
+parser.add_argument('--frequency', type=float,
+                    help='Center frequency of the capture in Hz, for --channelize (default: from SigMF metadata)')
+args = parser.parse_args()
+
+capture = Capture(args.iq_file, args.format, args.rate, args.frequency)
+if args.lookup and capture.format not in ('cs8', 'cu8'):
+    parser.error('--lookup only works with 8-bit formats')
+if args.channelize and args.lookup:
+    parser.error('--lookup can\'t be used with --channelize')
+if args.channelize and capture.frequency is None:
+    parser.error('--channelize needs to know the --frequency the capture was tuned to')
+
+# The bit rate and chip rate, from chapter 7
+BITRATE = 96000
+CHIPRATE = 1344000
+
+# All of the captures in this tutorial were made at 4 Msps, which is close
+# enough to 3 samples per chip (that would be 4.032 Msps) to use as-is. Any
+# other rate gets resampled to a whole number of samples per chip first (see
+# resampling.py). Doing that right at the start means a high-rate capture gets
+# cut down to size before any of the other work happens.
+rate = capture_rate = capture.sample_rate or 4000000
+samples_per_chip = args.samples_per_chip
+
+# With --channelize, a wideband capture first gets split up into one stream per
+# channel (see channelizer.py). Every stream after that gets its own resampler
+# and burst detector, since each one has its own DC offset, signal level and
+# half-finished burst to keep track of.
+if args.channelize:
+    channelizer = Channelizer(rate, capture.frequency)
+    if not channelizer.channels:
+        parser.error('no WaveBird channels fit in this capture')
+    channels = channelizer.channels
+    rate = channelizer.output_rate
+else:
+    channelizer = None
+    channels = [None] # Just the one, right in the middle
+
+if rate == 4000000 and samples_per_chip == 3:
+    resamplers = [None for channel in channels]
+elif args.lookup:
+    parser.error('--lookup only works on 4 Msps captures (they can\'t be resampled)')
+else:
+    resamplers = [Resampler(rate, samples_per_chip * CHIPRATE)
+                  for channel in channels]
+    rate = resamplers[0].output_rate
+
+# We're going to chunk apart *all* bursts, not just one from the middle.
+# Ignore bursts of wrong length (2-3ms, or 8000-12000 samples at 4 Msps).
+min_length = int(round(0.002 * rate))
+max_length = int(round(0.003 * rate))
+if args.lookup:
+    # The samples stay as raw bytes all the way through (see fm_demod.py)
+    detectors = [RawBurstDetector(min_length, max_length, format=capture.format)]
+else:
+    detectors = [BurstDetector(min_length, max_length) for channel in channels]
 
 # Now that we have our bursts, the actual decoding stuff comes next
 CHIPS = np.array([-1,  1, -1,  1,  1, -1, -1,  1, -1, -1,  1,  1,  1,  1])
-# Repeat each item 3 times to try to match the CHIPS rate to the sample rate
-CHIPS = CHIPS.repeat(3)
+# Repeat each item to match the CHIPS rate to the sample rate
+CHIPS = CHIPS.repeat(samples_per_chip)
 
 # Threshold for picking up the clock
 THRESHOLD = 20
 
-from collections import Counter
-counter = Counter()
-for burst in bursts:
-    # FM demodulation from last chapter
-    burst_conj = np.conjugate(burst)
-    autocorrelation = burst[1:] * burst_conj[:-1]
-    fm = np.angle(autocorrelation)
+# Every burst starts with 100us of plain carrier, before any chips. We measure
+# how far off frequency the controller is over most of that (leaving a little
+# room on either end, in case the burst detector was off by a few samples).
+WARMUP_START = int(round(0.00001 * rate))
+WARMUP_STOP = int(round(0.00009 * rate))
 
-    # The new part: correlating `fm` with `CHIPS`
-    correlation = np.correlate(fm, CHIPS)
+# The first bit comes right after that, so we look for the preamble starting
+# anywhere in the first 200us of a burst
+SYNC_SEARCH = int(round(0.0002 * rate))
 
-    # Find a correlation strong enough to call it the first bit
-    first_bit = np.argwhere(np.abs(correlation) > THRESHOLD)[0][0]
-    # Fast forward to it
-    correlation = correlation[first_bit:]
+# Rather than np.correlate() each burst on its own, we correlate all of the
+# bursts from a chunk in one go using FFTs (see matched_filter.py)
+matched_filter = MatchedFilter(CHIPS)
 
-    bits = ''
-    while len(correlation):
-        # Look for the strongest correlation somewhere in the window
-        strongest = np.argmax(np.abs(correlation[:5]))
+def decode_bursts(bursts, detector):
+    """
+    FM-demodulate each burst in 'bursts' (found by 'detector') and slice it
+    into bits, returning a list of the correlation at each bit (or None where
+    nothing could be decoded)
+    """
 
-        # Record its polarity in 'bits'
-        bits += ('1' if correlation[strongest] > 0 else '0')
+    # FM demodulation from last chapter, but for all of the bursts at once
+    # (see fm_demod.py)
+    tables = detector.tables if args.lookup else None
+    fm, spans = fm_demodulate_many(bursts, tables)
 
-        # Fast forward to where the next bit is expected
-        correlation = correlation[strongest + len(CHIPS) - 2:]
+    # A cheap radio (or controller) can easily be tens of kHz off, which would
+    # shift every value of `fm` up or down and throw off the correlation. The
+    # warmup tells us by how much, so we can take it back out (see fm_demod.py)
+    remove_carrier_offsets(fm, spans, WARMUP_START, WARMUP_STOP)
 
-    print(bits)
-    counter.update([bits])
+    # The new part: correlating `fm` with `CHIPS`
+    correlations = matched_filter.correlate_spans(fm, spans)
+
+    # Find a correlation strong enough to call it the first bit, with the rest
+    # of the WaveBird preamble after it (see sync_search.py). If there isn't
+    # one, nothing in here looks like a WaveBird.
+    scores, first_bits = find_preambles(correlations, rate / BITRATE,
+                                        samples_per_chip, SYNC_SEARCH, THRESHOLD)
+    found = scores >= args.sync_score
+
+    # Follow the bits from there on, keeping track of exactly where each one
+    # should be (see bit_slicing.py), and read them off the correlation
+    values = iter(recover_bits([correlation for correlation, ok
+                                in zip(correlations, found) if ok],
+                               first_bits[found], rate / BITRATE,
+                               samples_per_chip))
+    return [next(values) if ok else None for ok in found]
+
+def chunks_of_bursts():
+    """
+    Yield (channel, bursts) for each channel, chunk by chunk (where 'bursts'
+    is a list of (start, samples), and 'start' counts samples at 'rate')
+    """
+    for offset, samples in capture.chunks(raw=args.lookup):
+        streams = channelizer.process(samples) if channelizer else [samples]
+        for channel, samples, resampler, detector in zip(channels, streams,
+                                                         resamplers, detectors):
+            if resampler:
+                samples = resampler.process(samples)
+            yield channel, detector.feed(samples)
+
+    for channel, detector in zip(channels, detectors):
+        yield channel, detector.flush()
+
+soft_file = open(args.soft, 'wb') if args.soft else None
+frames_file = open(args.frames, 'wb') if args.frames else None
+if frames_file:
+    write_header(frames_file, capture_rate, capture.frequency)
+
+from collections import Counter, defaultdict
+counters = defaultdict(Counter)
+for channel, bursts in chunks_of_bursts():
+    detector = detectors[channels.index(channel)]
+    decoded = decode_bursts([burst for start, burst in bursts], detector)
+    for (start, burst), values in zip(bursts, decoded):
+        if values is None: continue
+
+        # The sign of the correlation is the bit, and how big it is says how
+        # sure we can be of it
+        hard = (values > 0).astype(np.uint8)
+        soft = soft_bits(values)
+        if soft_file:
+            write_soft(soft_file, soft)
+        if frames_file:
+            # Timestamped in samples of the original capture, which may not be
+            # what the bursts were found at (after channelizing or resampling)
+            offset = int(round(start * capture_rate / rate))
+            write_record(frames_file, make_record(hard, offset, channel, soft))
+
+        bits = bits_to_str(hard)
+        if channel is None:
+            print(bits)
+        else:
+            print('%2d %s' % (channel, bits))
+        counters[channel].update([bits])
+
+if soft_file:
+    soft_file.close()
+if frames_file:
+    frames_file.close()
 
 # Also print the most common (i.e. the 'mode') bitstring. The mode is the
 # most likely to be error-free and devoid of random noise from e.g. the analog
 # sticks.
-mode, times = counter.most_common(1)[0]
-
-# If the mode happens to be 200 bits, convert it to hex ;)
-if len(mode) == 200:
-    mode = '%050x' % int(mode, 2)
-
 print('-'*79)
-print('Mode: %s (%s times)' % (mode, times))
+for channel in channels:
+    if not counters[channel]: continue
+    mode, times = counters[channel].most_common(1)[0]
+
+    # If the mode happens to be 200 bits, convert it to hex ;)
+    if len(mode) == 200:
+        mode = '%050x' % int(mode, 2)
+
+    if channel is None:
+        print('Mode: %s (%s times)' % (mode, times))
+    else:
+        print('Channel %d mode: %s (%s times)' % (channel, mode, times))
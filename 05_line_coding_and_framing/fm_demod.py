@@ -0,0 +1,135 @@
+# FM demodulation, as in chapter 4: multiply each sample by the complex
+# conjugate of the one before it, and the angle of the result is how far the
+# phase turned in between, i.e. the instantaneous frequency.
+#
+# Doing that burst by burst means three new arrays (the conjugate, the product
+# and the angles) for every burst, plus a handful of numpy calls that each have
+# their own overhead. A chunk of capture has dozens of bursts in it, so instead
+# we string them all together and demodulate them in one go.
+
+import numpy as np
+
+from iq_files import FORMATS
+
+def fm_demodulate(samples):
+    """
+    FM-demodulate 'samples', returning the phase change (in radians) from each
+    sample to the next
+    """
+    autocorrelation = samples[1:] * np.conjugate(samples[:-1])
+    return np.angle(autocorrelation)
+
+class Int8Tables(object):
+    """
+    Lookup tables for the angle and magnitude of every possible 8-bit (I, Q)
+    sample, with the DC spike 'dc' already taken out
+
+    Our samples only ever come in 256*256 = 65536 different flavors, so rather
+    than converting each one to a complex number and asking numpy for its angle
+    (which is a fairly expensive arctangent), we can work out all 65536 answers
+    ahead of time and just look them up.
+
+    The tables are indexed by the raw I and Q bytes read as one little-endian
+    uint16, i.e. just the way Capture.chunks(..., raw=True) hands them out, so
+    there's no arithmetic at all to find where a sample's answer is.
+
+    'format' is the 8-bit format (see iq_files.FORMATS) the bytes are in.
+    """
+
+    def __init__(self, dc=0j, format='cs8'):
+        self.dc = dc
+
+        # What each byte value means as a sample
+        dtype, zero, scale = FORMATS[format]
+        values = (np.arange(256, dtype=np.uint8).view(dtype) - zero) / scale
+
+        # The high byte is Q, so it picks the row; the low byte is I
+        i = values[np.newaxis, :] - dc.real
+        q = values[:, np.newaxis] - dc.imag
+
+        # The angles are stored as 16-bit integers, where 65536 is a full
+        # circle. That way, when we subtract two angles, the integer simply
+        # overflows and wraps around to the right answer, just like the angle
+        # itself would.
+        angle = np.round(np.arctan2(q, i) * (32768/np.pi))
+        self.angle = angle.astype(np.int32).astype(np.int16).ravel()
+        self.magnitude = np.hypot(i, q).astype(np.float32).ravel()
+
+def fm_demodulate_codes(codes, tables):
+    """
+    FM-demodulate raw 8-bit samples 'codes' (see Int8Tables) using lookups
+    instead of complex arithmetic
+    """
+
+    # The phase change from one sample to the next is just the difference
+    # between their angles (wrapping around as explained in Int8Tables)
+    angles = tables.angle.take(codes)
+    fm = angles[1:] - angles[:-1]
+
+    # Back to radians
+    return fm * np.float32(np.pi/32768)
+
+def pack_bursts(bursts):
+    """
+    String the list of arrays 'bursts' together, returning (samples, offsets)
+
+    Burst 'i' ends up at samples[offsets[i]:offsets[i+1]].
+    """
+    offsets = np.cumsum([0] + [len(burst) for burst in bursts])
+    return np.concatenate(bursts), offsets
+
+def fm_demodulate_many(bursts, tables=None):
+    """
+    FM-demodulate every burst in the list 'bursts' at once
+
+    Returns (fm, spans), where 'fm' is one array holding all of the results,
+    and the result for burst 'i' is fm[spans[i][0]:spans[i][1]]. (Where one
+    burst meets the next, there's one value that's the phase change from the
+    end of the first to the start of the second; that's meaningless, so the
+    spans skip over it.)
+
+    If 'tables' is given, the bursts are raw 8-bit samples and are demodulated
+    with fm_demodulate_codes() instead.
+    """
+    if not len(bursts):
+        return np.zeros(0, dtype=np.float32), np.zeros((0, 2), dtype=int)
+
+    samples, offsets = pack_bursts(bursts)
+    if tables is None:
+        fm = fm_demodulate(samples)
+    else:
+        fm = fm_demodulate_codes(samples, tables)
+
+    spans = np.column_stack([offsets[:-1], np.maximum(offsets[1:] - 1,
+                                                      offsets[:-1])])
+    return fm, spans
+
+def remove_carrier_offsets(fm, spans, start, stop):
+    """
+    Estimate how far off frequency each burst in 'fm' is, and take that out
+
+    'spans' is as returned by fm_demodulate_many(), and fm[i+start:i+stop]
+    (where 'i' is where a burst starts) is expected to be plain carrier, e.g.
+    the warmup at the start of every WaveBird burst. If the transmitter and the
+    radio don't quite agree on the frequency, the carrier keeps turning a
+    little bit from one sample to the next, and that turn gets added to every
+    other sample, too; the average of fm[] over the carrier is exactly how much.
+
+    'fm' is corrected in place. Returns the offset (in radians per sample) of
+    each burst.
+    """
+    if not len(spans):
+        return np.zeros(0, dtype=fm.dtype)
+
+    # Every burst's average at once: with a running total of fm[], the sum
+    # between any two points is just the difference of two totals
+    totals = np.concatenate([[0], np.cumsum(fm, dtype=float)])
+    first = np.minimum(spans[:, 0] + start, spans[:, 1])
+    last = np.minimum(spans[:, 0] + stop, spans[:, 1])
+    offsets = (totals[last] - totals[first]) / np.maximum(last - first, 1)
+    offsets = offsets.astype(fm.dtype)
+
+    # Each burst's correction runs from its own start to the next one's
+    lengths = np.diff(np.append(spans[:, 0], len(fm)))
+    fm -= np.repeat(offsets, lengths)
+    return offsets
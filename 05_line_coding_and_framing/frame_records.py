@@ -0,0 +1,123 @@
+# Saving decoded frames in a compact binary file.
+#
+# decode_wavebird.py prints every frame as a line of 200 '0's and '1's, which
+# is easy to read (and grep), but takes 8 times the space it needs, and reading
+# it back means checking and parsing every line all over again. A long session
+# of button-mashing adds up to a lot of those.
+#
+# Instead, each frame can be written as a fixed-size record: its 200 bits
+# packed into 25 bytes, plus where it was found in the capture. Since every
+# record is the same size, a whole file of them can be np.memmap()'d as one big
+# structured array, with nothing to parse at all (see read_frames()).
+#
+# The file starts with a small header, so it can't be mistaken for anything
+# else, and so the timestamps can be turned back into seconds.
+
+import binascii
+import numpy as np
+
+MAGIC = b'WBFR'
+VERSION = 1
+
+HEADER = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u2'),
+    ('record_size', '<u2'), # RECORD.itemsize, as a sanity check
+    ('sample_rate', '<f8'), # Of the capture, in samples/sec
+    ('frequency', '<f8'),   # Center frequency, in Hz (NaN if unknown)
+])
+
+FRAME_BITS = 200
+FRAME_BYTES = FRAME_BITS // 8
+
+RECORD = np.dtype([
+    ('offset', '<u8'),               # Capture sample the burst started at
+    ('frame', 'u1', (FRAME_BYTES,)), # The bits, first one sent in the MSB
+    ('bits', 'u1'),                  # How many were decoded (200, up to 255)
+    ('channel', 'u1'),               # WaveBird channel (0 if not channelized)
+    ('quality', 'u1'),               # How sure we were of the shakiest bit
+])
+
+# 'quality' is the smallest size of any of the frame's soft bits (see
+# bit_slicing.soft_bits(), which scales those so 32 is average); this means
+# there weren't any soft bits to go by
+NO_QUALITY = 255
+
+def write_header(output, sample_rate, frequency=None):
+    """
+    Start the binary file 'output' off with a header for a capture at
+    'sample_rate', tuned to 'frequency' (if known)
+    """
+    header = np.zeros(1, dtype=HEADER)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['record_size'] = RECORD.itemsize
+    header['sample_rate'] = sample_rate
+    header['frequency'] = np.nan if frequency is None else frequency
+    output.write(header.tobytes())
+
+def make_record(bits, offset, channel=None, soft=None):
+    """
+    Build the record for one frame: 'bits' is an array of its 0's and 1's
+    (only the first 200 are stored, but 'bits' counts all of them), 'offset'
+    is the capture sample it started at, 'channel' is its channel (if known),
+    and 'soft' is its soft bits (if any)
+    """
+    bits = np.asarray(bits, dtype=np.uint8)
+
+    record = np.zeros(1, dtype=RECORD)
+    record['offset'] = offset
+    # (how many bits there really were, even past 200, so frame_ints() can
+    # leave out anything that isn't exactly a frame, like the text path does)
+    record['bits'] = min(len(bits), 255)
+    bits = bits[:FRAME_BITS]
+    record['frame'][0, :] = np.packbits(np.append(bits, np.zeros(FRAME_BITS -
+                                                  len(bits), dtype=np.uint8)))
+    record['channel'] = channel or 0
+    if soft is None or not len(soft):
+        record['quality'] = NO_QUALITY
+    else:
+        soft = np.asarray(soft[:FRAME_BITS], dtype=int)
+        record['quality'] = min(np.min(np.abs(soft)), NO_QUALITY - 1)
+    return record
+
+def write_record(output, record):
+    """
+    Append a record from make_record() to the binary file 'output'
+    """
+    output.write(record.tobytes())
+
+def is_frame_file(filename):
+    """
+    Check whether 'filename' starts with a frame file header
+    """
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read_frames(filename):
+    """
+    Open a file written with write_header() and write_record(), returning its
+    header, and all of its records as one memory-mapped RECORD array
+    """
+    header = np.fromfile(filename, dtype=HEADER, count=1)
+    if (len(header) < 1 or header['magic'][0] != MAGIC or
+        header['version'][0] != VERSION or
+        header['record_size'][0] != RECORD.itemsize):
+        raise ValueError('%s is not a WaveBird frame file' % filename)
+
+    # (np.memmap() can't map nothing at all)
+    with open(filename, 'rb') as f:
+        f.seek(0, 2)
+        count = (f.tell() - HEADER.itemsize) // RECORD.itemsize
+    if not count:
+        return header[0], np.zeros(0, dtype=RECORD)
+    return header[0], np.memmap(filename, dtype=RECORD, mode='r',
+                                offset=HEADER.itemsize, shape=(count,))
+
+def frame_ints(records):
+    """
+    Yield each of the complete (200-bit) frames in 'records' as an int, the
+    same as int(line, 2) on a line of decode_wavebird.py's text output
+    """
+    for record in records[records['bits'] == FRAME_BITS]:
+        yield int(binascii.hexlify(record['frame'].tobytes()), 16)
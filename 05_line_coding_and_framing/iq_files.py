@@ -0,0 +1,162 @@
+# Reading a whole .iq file in with np.fromfile() is fine for a few seconds of
+# capture, but the way chapter 4 does it, every 2 bytes on disk turn into a
+# 16-byte complex number in memory, so a minute-long recording at 4 Msps would
+# need about 4 GB of RAM before we even start decoding. Instead, we ask the OS
+# to "memory-map" the file (so it only pages in the parts we actually touch)
+# and hand it out a chunk at a time.
+#
+# We also stick to single-precision (complex64) samples. An 8-bit ADC doesn't
+# give us anywhere near enough precision to need doubles, and half the bytes
+# means half the memory bandwidth for every step that follows.
+#
+# Not every radio writes the same kind of file, either. The HackRF gives signed
+# 8-bit I/Q, but an RTL-SDR gives unsigned 8-bit, an Airspy gives signed
+# 16-bit, and GNU Radio likes 32-bit floats. They're all just interleaved I/Q
+# pairs, though, so the only difference is how to turn each number into a
+# float. We do that conversion a chunk at a time, too, so we never have a float
+# copy of the whole recording lying around.
+
+import os
+import sys
+import json
+import numpy as np
+
+# How each format stores I and Q: (numpy type, zero point, full scale)
+FORMATS = {
+    'cs8': (np.dtype(np.int8), 0., 128.),      # HackRF
+    'cu8': (np.dtype(np.uint8), 127.5, 128.),  # RTL-SDR
+    'cs16': (np.dtype('<i2'), 0., 32768.),     # Airspy
+    'cf32': (np.dtype('<f4'), 0., 1.),         # GNU Radio
+}
+
+# Guesses based on the file extension
+EXTENSIONS = {
+    '.iq': 'cs8', # What hackrf_transfer (and this tutorial) uses
+    '.cs8': 'cs8',
+    '.cu8': 'cu8',
+    '.cs16': 'cs16',
+    '.cf32': 'cf32',
+    '.fc32': 'cf32',
+    '.cfile': 'cf32',
+}
+
+# The names SigMF (https://sigmf.org/) uses for the same formats
+SIGMF_DATATYPES = {
+    'ci8': 'cs8',
+    'cu8': 'cu8',
+    'ci16_le': 'cs16',
+    'cf32_le': 'cf32',
+}
+
+class Capture(object):
+    """
+    An I/Q recording in one of the FORMATS
+
+    'format' is guessed from the file extension if not given, falling back on
+    HackRF-style 'cs8'. If 'filename' is a SigMF recording (either the
+    .sigmf-meta or the .sigmf-data file), its format, sample rate and center
+    frequency are read from the metadata, unless they were passed in. They're
+    None if unknown.
+
+    A 'filename' of '-' reads from standard input, so the output of e.g.
+    `hackrf_transfer -r -` can be decoded as it arrives.
+    """
+
+    def __init__(self, filename, format=None, sample_rate=None, frequency=None):
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.frequency = frequency
+
+        base, extension = os.path.splitext(filename)
+        if extension in ('.sigmf-meta', '.sigmf-data'):
+            self.filename = base + '.sigmf-data'
+            with open(base + '.sigmf-meta') as meta_file:
+                meta = json.load(meta_file)
+
+            datatype = meta['global']['core:datatype']
+            if datatype not in SIGMF_DATATYPES:
+                raise ValueError('unsupported SigMF datatype %r' % datatype)
+            format = format or SIGMF_DATATYPES[datatype]
+
+            if self.sample_rate is None:
+                self.sample_rate = meta['global'].get('core:sample_rate')
+            captures = meta.get('captures') or [{}]
+            if self.frequency is None:
+                self.frequency = captures[0].get('core:frequency')
+
+        self.format = format or EXTENSIONS.get(extension.lower(), 'cs8')
+        if self.format not in FORMATS:
+            raise ValueError('unsupported format %r' % self.format)
+
+    def chunks(self, chunk_size=1<<20, raw=False):
+        """
+        Yield (offset, samples) pairs covering the whole capture
+
+        'samples' is a complex64 array of up to chunk_size samples, and
+        'offset' is the index (in samples, from the start of the capture) of
+        its first sample.
+
+        If 'raw' is set (8-bit formats only), the samples aren't converted at
+        all: each one comes out as a uint16 holding the I byte (low) and Q byte
+        (high) exactly as they were in the file. See fm_demod.Int8Tables for
+        what that's good for.
+        """
+
+        dtype = FORMATS[self.format][0]
+        if raw and dtype.itemsize != 1:
+            raise ValueError('raw samples are only available for 8-bit formats')
+
+        if self.filename == '-':
+            # Pipes can't be memory-mapped, so fall back on plain reads
+            stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+            chunks = _read_chunks(stdin, dtype, chunk_size)
+        else:
+            chunks = _map_chunks(self.filename, dtype, chunk_size)
+
+        for offset, chunk in chunks:
+            if raw:
+                yield offset, chunk.view('<u2')
+            else:
+                yield offset, to_complex64(chunk, self.format)
+
+def to_complex64(raw, format='cs8'):
+    """
+    Convert interleaved I/Q values 'raw' (in one of the FORMATS) to complex64
+    samples
+
+    This takes a single pass: the values are scaled straight into
+    single-precision floats, and since numpy stores a complex64 as a pair of
+    float32s (real, then imaginary) - exactly the order the floats are already
+    in - we can just look at them as complex numbers without copying anything.
+    """
+
+    dtype, zero, scale = FORMATS[format]
+    if dtype == np.float32 and scale == 1:
+        # Already floats; nothing to convert at all
+        return raw.view(np.complex64)
+
+    samples = np.multiply(raw, np.float32(1/scale), dtype=np.float32)
+    if zero:
+        samples -= np.float32(zero/scale)
+    return samples.view(np.complex64)
+
+def _map_chunks(filename, dtype, chunk_size):
+    raw = np.memmap(filename, dtype=dtype, mode='r')
+    total = len(raw)//2 # Interleaved I/Q, so 2 values per sample
+
+    for offset in range(0, total, chunk_size):
+        # Only this slice gets read from disk
+        yield offset, raw[2*offset : 2*min(offset + chunk_size, total)]
+
+def _read_chunks(stream, dtype, chunk_size):
+    sample_size = 2*dtype.itemsize
+
+    offset = 0
+    while True:
+        data = stream.read(sample_size*chunk_size)
+        if len(data) < sample_size: break
+
+        raw = np.frombuffer(data[:len(data)//sample_size*sample_size],
+                            dtype=dtype)
+        yield offset, raw
+        offset += len(raw)//2
@@ -0,0 +1,86 @@
+# Correlating against the chipping sequence with FFTs.
+#
+# np.correlate() works sample by sample: for every output, it multiplies the
+# whole template against the signal and adds it all up, so the work grows with
+# the length of the template. Chapter 3 showed that the Fourier transform turns
+# that kind of sliding multiply-and-add into a plain multiplication, one
+# frequency at a time. So we take the FFT of a stretch of signal, multiply it by
+# the (precomputed) spectrum of the template, and take the inverse FFT to get a
+# whole stretch of correlation at once. Apart from the FFTs themselves (which
+# are cheap), the template's length hardly matters anymore.
+#
+# The FFT treats its input as if it wraps around in a circle, so the last
+# len(template)-1 outputs of each FFT are garbage. The "overlap-save" method
+# just throws them away and starts the next FFT that much earlier to make up
+# for it.
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+class MatchedFilter(object):
+    """
+    Correlate real-valued signals against a fixed real-valued template
+    """
+
+    def __init__(self, template, fft_size=None):
+        self.template = np.asarray(template, dtype=np.float32)
+
+        if fft_size is None:
+            # Big enough that not too much of each FFT is thrown away
+            fft_size = max(4096, 1 << int(8*len(self.template) - 1).bit_length())
+        assert fft_size >= len(self.template)
+        self.fft_size = fft_size
+
+        # How many good outputs we get from each FFT
+        self.step = fft_size - len(self.template) + 1
+
+        # Correlating is convolving with the template backwards, which in the
+        # frequency domain means using the complex conjugate of its spectrum
+        spectrum = np.conj(np.fft.rfft(self.template, fft_size))
+        self.spectrum = spectrum.astype(np.complex64)
+
+    def correlate(self, signal):
+        """
+        Return the same thing as np.correlate(signal, template)
+        """
+
+        outputs = len(signal) - len(self.template) + 1
+        if outputs <= 0:
+            return np.zeros(0, dtype=np.float32)
+
+        # Cut the signal into FFT-sized blocks, each one starting 'step'
+        # samples after the last (so they overlap). Zero-padding the end makes
+        # sure the last block is complete.
+        blocks = -(-outputs // self.step)
+        padded = np.zeros((blocks - 1)*self.step + self.fft_size,
+                          dtype=np.float32)
+        padded[:len(signal)] = signal
+        stride = padded.strides[0]
+        padded = as_strided(padded, shape=(blocks, self.fft_size),
+                            strides=(self.step*stride, stride))
+
+        # All of the blocks go through the FFT together
+        spectra = np.fft.rfft(padded, axis=1) * self.spectrum
+        correlation = np.fft.irfft(spectra, self.fft_size, axis=1)
+
+        # Keep only the good part of each block
+        return correlation[:, :self.step].ravel()[:outputs]
+
+    def correlate_spans(self, signal, spans):
+        """
+        Correlate each signal[start:stop] for the (start, stop) pairs in
+        'spans', returning a list of the results
+
+        The whole of 'signal' is correlated in one go, and the outputs that
+        aren't entirely inside one of the spans are just thrown away. That saves
+        a lot of overhead when there are many short signals (e.g. all of the
+        bursts in a chunk of capture).
+        """
+
+        correlation = self.correlate(signal)
+
+        results = []
+        for start, stop in spans:
+            outputs = max(stop - start - len(self.template) + 1, 0)
+            results.append(correlation[start:start + outputs])
+        return results
@@ -0,0 +1,90 @@
+# Changing the sample rate of a capture.
+#
+# The decoder wants a whole number of samples per chip, so that the chipping
+# sequence can simply be stretched to match (see CHIPS.repeat() in
+# decode_wavebird.py). Radios don't all record at the same rate, though, so we
+# convert whatever we're given to the rate we want first.
+#
+# The textbook way to change the rate by a fraction up/down is: put up-1 zeros
+# between every pair of samples, low-pass filter the result to smooth out the
+# gaps (and to get rid of anything that won't fit under the new Nyquist
+# frequency), then keep only every down'th sample. Done literally, that's a lot
+# of wasted effort: most of what goes into the filter is zeros, and most of
+# what comes out is thrown away. A "polyphase" resampler skips all of that by
+# only ever computing the outputs we keep, using only the filter taps that land
+# on real samples. Which taps those are cycles through 'up' different patterns
+# (the "phases"), so we split the filter into that many small filters ahead of
+# time.
+
+from __future__ import division
+
+import numpy as np
+from fractions import Fraction
+
+class Resampler(object):
+    """
+    Convert a stream of complex samples from 'input_rate' to (as close as
+    possible to) 'output_rate', one block at a time
+
+    The ratio between the two rates is approximated by a fraction with a
+    denominator no bigger than 'max_denominator'; 'output_rate' is updated to
+    the rate that's actually produced. 'zero_crossings' sets how long the
+    filter is (longer filters are sharper but slower).
+    """
+
+    def __init__(self, input_rate, output_rate, zero_crossings=8,
+                 max_denominator=1000):
+        ratio = Fraction(output_rate/input_rate).limit_denominator(max_denominator)
+        self.up, self.down = ratio.numerator, ratio.denominator
+        self.input_rate = input_rate
+        self.output_rate = input_rate * self.up / self.down
+
+        # Low-pass filter (running at the "zero-stuffed" rate of up*input_rate)
+        # that cuts off at whichever Nyquist frequency is lower, input or
+        # output. It's a "windowed sinc": the sinc function is what an ideal
+        # low-pass filter looks like, and the window trims it down to a
+        # manageable length without too much ringing.
+        cutoff = 0.5 / max(self.up, self.down)
+        length = 2 * zero_crossings * max(self.up, self.down) + 1
+        t = np.arange(length) - (length - 1)/2
+        prototype = np.sinc(2*cutoff*t) * np.kaiser(length, 8.0)
+        prototype *= self.up / np.sum(prototype) # Make up for the zeros
+
+        # Split it into 'up' phases: bank[j, p] is the tap that multiplies the
+        # j'th most recent input sample when the output lands at phase p
+        self.taps = -(-length // self.up)
+        padded = np.zeros(self.taps * self.up)
+        padded[:length] = prototype
+        self.bank = padded.reshape(self.taps, self.up).astype(np.float32)
+
+        # The last few input samples, which the start of the next block still
+        # needs
+        self.history = np.zeros(self.taps - 1, dtype=np.complex64)
+        # Where the next output lands, in zero-stuffed samples from the start
+        # of the next block
+        self.next_output = 0
+
+    def process(self, samples):
+        """
+        Resample the next block of 'samples', returning the output samples
+        that are ready
+        """
+
+        extended = np.concatenate([self.history, samples.astype(np.complex64)])
+        self.history = extended[len(extended) - len(self.history):]
+
+        # Every output that lands inside this block...
+        stuffed_length = len(samples) * self.up
+        positions = np.arange(self.next_output, stuffed_length, self.down)
+        self.next_output = (self.next_output - stuffed_length +
+                            len(positions) * self.down)
+
+        # ...is a combination of the sample just before it and the few before
+        # that, weighted by one phase of the filter
+        newest = positions // self.up + len(self.history)
+        phases = positions % self.up
+
+        output = np.zeros(len(positions), dtype=np.complex64)
+        for j in range(self.taps):
+            output += self.bank[j][phases] * extended[newest - j]
+        return output
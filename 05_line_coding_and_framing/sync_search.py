@@ -0,0 +1,93 @@
+# Checking that a burst really is a WaveBird frame before decoding it.
+#
+# Anything on 2.4 GHz that's about the right length gets through the burst
+# detector: Wi-Fi, Bluetooth, the microwave... Most of it doesn't look anything
+# like our chips, but some of it correlates well enough somewhere to get past
+# THRESHOLD, and then it gets sliced into 200 bits of garbage that only get
+# thrown out much later (when chapter 6 checks for 0xfaaaaaaa1234).
+#
+# Every WaveBird frame starts with the same 48 bits, though (see chapter 7), so
+# we can check for those straight from the chip correlation: if the burst is a
+# WaveBird, there's a run of peaks one bit apart near its start, with the signs
+# of those bits. That's a lot cheaper than slicing the whole burst, and much
+# harder for anything else to fake than a single strong correlation.
+
+import numpy as np
+
+# The preamble and sync word, from chapter 7
+PREAMBLE = 0xfaaaaaaa1234
+PREAMBLE_LENGTH = 48
+
+def find_preambles(correlations, samples_per_bit, samples_per_chip, search,
+                   threshold):
+    """
+    Look for the preamble starting in the first 'search' samples of each of
+    the chip 'correlations', returning two arrays: how well it matched, and
+    where its first bit is
+
+    The score is the sum of the correlation at each preamble bit, with the
+    sign flipped for the 0's, divided by the sum of its size: 1 means every
+    bit matched, and random noise comes out at around 0. Like in
+    bit_slicing.recover_bits(), each bit's peak is looked for within a chip of
+    one bit after the last one's, so the bits don't have to be exactly where
+    we'd expect them if the transmitter's clock is a little off.
+
+    The first bit has to be a peak stronger than 'threshold'; that leaves only
+    a handful of places in each burst to try. Where there isn't one at all, the
+    score is NaN (which never compares as bigger than anything).
+    """
+
+    count = len(correlations)
+    scores = np.full(count, np.nan, dtype=np.float32)
+    first_bits = np.zeros(count, dtype=int)
+    if not count:
+        return scores, first_bits
+
+    # Which way each bit of the preamble should point
+    signs = np.array([1 if PREAMBLE >> (PREAMBLE_LENGTH - 1 - bit) & 1 else -1
+                      for bit in range(PREAMBLE_LENGTH)], dtype=np.float32)
+
+    # Only the start of each burst matters; line those up in one 2D array,
+    # with a chip of zeros on either end so every sample has a full chip on
+    # both sides
+    needed = search + int(PREAMBLE_LENGTH * samples_per_bit)
+    padded = np.zeros((count, samples_per_chip + needed + samples_per_chip),
+                      dtype=np.float32)
+    for row, correlation in zip(padded, correlations):
+        start = correlation[:needed]
+        row[samples_per_chip:samples_per_chip + len(start)] = start
+    strength = np.abs(padded)
+
+    # Every strong peak near the start of a burst could be the first bit
+    start = strength[:, samples_per_chip:samples_per_chip + search]
+    before = strength[:, samples_per_chip - 1:samples_per_chip + search - 1]
+    after = strength[:, samples_per_chip + 1:samples_per_chip + search + 1]
+    rows, candidates = np.nonzero((start > threshold) &
+                                  (start >= before) & (start >= after))
+    if not len(rows):
+        return scores, first_bits
+
+    # Find the peak for each of the preamble's bits, the strongest sample
+    # within a chip of where it should be, trying every candidate at once
+    around = np.arange(-samples_per_chip, samples_per_chip + 1)
+    peaks = np.zeros((len(rows), PREAMBLE_LENGTH), dtype=np.float32)
+    position = samples_per_chip + candidates.astype(float)
+    for bit in range(PREAMBLE_LENGTH):
+        nearest = np.clip(np.round(position).astype(int), samples_per_chip,
+                          padded.shape[1] - samples_per_chip - 1)
+        nearby = nearest[:, np.newaxis] + around
+        peak = nearest + around[np.argmax(strength[rows[:, np.newaxis], nearby],
+                                          axis=1)]
+        peaks[:, bit] = padded[rows, peak]
+        position = peak + samples_per_bit
+
+    # ...and compare their signs with the ones they should have
+    matches = np.dot(peaks, signs) / np.maximum(np.sum(np.abs(peaks), axis=1), 1e-6)
+
+    # Keep the best match in each burst: sorted by burst, then by score, the
+    # best one for each burst is the last before the next burst's
+    order = np.lexsort([matches, rows])
+    last = order[np.append(rows[order][1:] != rows[order][:-1], True)]
+    scores[rows[last]] = matches[last]
+    first_bits[rows[last]] = candidates[last]
+    return scores, first_bits
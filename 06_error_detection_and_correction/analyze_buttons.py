@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from cyclic_code import full_correct
+
 # The buttons on the controller (in no particluar order)
 BUTTONS = ['A', 'B', 'X', 'Y', 'START', 'Z', 'UP', 'DOWN', 'LEFT', 'RIGHT', 'L', 'R']
 
@@ -59,41 +61,10 @@ MESSAGES = {
     R+B: 0x088804045d7167a7c32e2fb2d1e3373,
 }
 
-# Include our decode function, modified to work on a SINGLE 31-bit block
-def cyclic_decode(x):
-    g = 0b11101101001
-
-    msg = 0
-    for i in range(21):
-        msg = msg << 1
-        if x&1:
-            x ^= g
-            msg |= 1
-        x = x >> 1
-
-    assert x == 0 # Ensure everything got cleared (i.e. no bit errors)
-
-    return msg
-
-# This deinterleaves the 124-bit block into 4x 31-bit
-def deinterleave(x):
-    a = b = c = d = 0
-
-    for i in range(124):
-        d |= (x & 1) << (i//4)
-        x = x >> 1
-        a, b, c, d = d, a, b, c
-
-    return (a, b, c, d)
-
-# And this does a full decode
+# Decode a 124-bit block (cyclic_code.py does the deinterleaving and decoding
+# of each 31-bit block; this blows up if there were too many bit errors)
 def full_decode(x):
-    a, b, c, d = deinterleave(x)
-
-    return (cyclic_decode(a) << 63 |
-            cyclic_decode(b) << 42 |
-            cyclic_decode(c) << 21 | 
-            cyclic_decode(d))
+    return full_correct(x)[0]
 
 # Now find the difference masks for each button
 BUTTON_MASKS = {}
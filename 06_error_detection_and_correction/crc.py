@@ -0,0 +1,117 @@
+# A faster CRC-16 for the WaveBird.
+#
+# generate_message.py used to compute the CRC with the shift register from the
+# README, which takes one trip around a Python loop for every bit of input. The
+# shift register starts out holding the polynomial, and every shift multiplies
+# it by x (mod the polynomial), so the value it XORs in for bit 'i' is always
+# x^(16+i) mod the polynomial. Add those up for all of the set bits and that's
+# the usual CRC-16 (the XMODEM flavor, with no initial value or final XOR),
+# reading the input MSB-first.
+#
+# And the usual CRC-16 can be done a byte at a time: whatever the top byte of
+# the CRC is (XORed with the next byte of input), it'll get shifted out over
+# the next 8 bits, XORing the same things into the rest of the CRC every time.
+# So we work out what those are for all 256 possible bytes ahead of time.
+
+import numpy as np
+
+from interleaving import CRC_INTERLEAVER
+
+G = 0x1021 # Polynomial
+
+def _crc16_bitwise(n):
+    # The shift register version from generate_message.py, used to build the
+    # table
+    crc = 0
+    r = G
+    while n:
+        if n&1:
+            crc ^= r
+        n >>= 1
+        r <<= 1
+        if r&0x10000:
+            r ^= G
+            r &= 0xFFFF
+    return crc
+
+# What the CRC of each possible byte on its own is
+CRC_TABLE = [_crc16_bitwise(byte) for byte in range(256)]
+
+def crc16(n):
+    """
+    Compute CRC-CCITT on the bits of integer 'n'
+
+    Gives exactly the same answers as the shift register version, a byte at a
+    time.
+    """
+
+    crc = 0
+    for shift in range((n.bit_length() - 1)//8 * 8, -8, -8):
+        byte = (n >> shift) & 0xFF
+        crc = (crc << 8 & 0xFFFF) ^ CRC_TABLE[(crc >> 8) ^ byte]
+
+    return crc
+
+# Checking whole logs' worth of messages at once.
+#
+# The WaveBird's CRC is computed over the message after it's been interleaved
+# (see generate_message.py), then XORed with 0xce98. Interleaving just moves
+# bits around, so like the CRC itself, it's linear: the CRC of a message is the
+# XOR of the CRCs each of its bytes would have on their own. That means we can
+# fold the interleaving into the tables, one table per byte of the message, and
+# then checking any number of messages is just 11 lookups and XORs each.
+
+CRC_XOR = 0xce98
+
+def _message_crc_tables():
+    # What each bit of the message adds to the CRC...
+    bits = np.array([crc16(CRC_INTERLEAVER.interleave(1 << i))
+                     for i in range(84)] + [0]*4, dtype=np.uint16)
+
+    # ...and so what each value of each byte adds. Byte 'k' (counting from the
+    # most significant) holds bits 80-8k to 87-8k; only 4 bits of the top one
+    # count.
+    values = (np.arange(256)[:, np.newaxis] >> np.arange(8)) & 1
+    tables = np.zeros((11, 256), dtype=np.uint16)
+    for k in range(11):
+        for bit in range(8):
+            tables[k][values[:, bit] == 1] ^= bits[8*(10 - k) + bit]
+    return tables
+
+# MESSAGE_CRC_TABLES[k][byte] is what 'byte' adds to the CRC as the k'th byte
+MESSAGE_CRC_TABLES = _message_crc_tables()
+
+def message_bytes(raw):
+    """
+    Turn an array of 84-bit messages into an (N, 11) uint8 array of their
+    bytes, most significant first
+
+    'raw' can already be that, or it can be an (N, 2) uint64 array holding the
+    top 20 bits and the bottom 64 bits of each message.
+    """
+    raw = np.asarray(raw)
+    if raw.dtype == np.uint8:
+        return raw.reshape(-1, 11)
+
+    words = raw.reshape(-1, 2).astype('>u8')
+    return words.view(np.uint8).reshape(-1, 16)[:, 5:]
+
+def wavebird_crcs(raw):
+    """
+    Work out the CRC each of an array of 84-bit messages 'raw' (see
+    message_bytes() for the layout) should be sent with, returning them as a
+    uint16 array
+    """
+    raw = message_bytes(raw)
+    crcs = np.full(len(raw), CRC_XOR, dtype=np.uint16)
+    for k in range(11):
+        crcs ^= MESSAGE_CRC_TABLES[k][raw[:, k]]
+    return crcs
+
+def check_crcs(raw, crcs):
+    """
+    Check an array of 84-bit messages 'raw' (see message_bytes() for the
+    layout) against the 16-bit 'crcs' they were sent with, returning an array
+    of True/False
+    """
+    return wavebird_crcs(raw) == crcs
@@ -0,0 +1,241 @@
+# The WaveBird's FEC: 4 POCSAG-style (31,21) cyclic codes, interleaved.
+#
+# The README stops at error _detection_: cyclic_decode() divides the codeword
+# by the generator polynomial, and if anything's left over, there was a bit
+# error somewhere. But what's left over (the "syndrome") isn't just a yes/no:
+# the division is linear, so the syndrome only depends on which bits were
+# flipped, not on the message. With a distance of 5, every single- and
+# double-bit error leaves a different syndrome, so a table from syndrome back
+# to error pattern is all it takes to fix those (see cyclic_correct()).
+#
+# The radio can also tell us more than just 0 or 1: with soft bits (see
+# chapter 5's bit_slicing.py), we know which bits were the shakiest. That lets
+# us go past two errors per codeword, by guessing which of the shakiest bits
+# might be wrong and seeing whether the table can fix whatever's left (this is
+# called a "Chase" decoder). Those guesses can come up with more than one
+# answer, but the CRC tells us which is right.
+
+import itertools
+import numpy as np
+
+from crc import crc16, message_bytes
+from interleaving import CRC_INTERLEAVER, FEC_INTERLEAVER
+
+G = 0b11101101001 # Generator polynomial
+
+def cyclic_divide(x):
+    """
+    Divide the 31-bit codeword 'x' by the generator polynomial, returning the
+    21-bit message and the 10-bit remainder (the syndrome; 0 if there were no
+    bit errors)
+    """
+    msg = 0
+    for i in range(21):
+        msg = msg << 1
+        if x&1:
+            x ^= G
+            msg |= 1
+        x = x >> 1
+
+    return msg, x
+
+def cyclic_decode(x):
+    """
+    Decode a 31-bit codeword 'x' (blowing up if it has any bit errors)
+    """
+    msg, syndrome = cyclic_divide(x)
+    assert syndrome == 0 # Ensure everything got cleared (i.e. no bit errors)
+    return msg
+
+# The syndrome of each single-bit error, and (since it's linear) the syndrome
+# of any error is just the XOR of those
+BIT_SYNDROMES = np.array([cyclic_divide(1<<i)[1] for i in range(31)])
+
+def _error_patterns():
+    patterns = np.full(1024, -1, dtype=np.int64) # -1: can't be fixed
+    counts = np.full(1024, -1, dtype=np.int8)
+    patterns[0] = counts[0] = 0
+    for count in (1, 2):
+        for bits in itertools.combinations(range(31), count):
+            syndrome = np.bitwise_xor.reduce(BIT_SYNDROMES[list(bits)])
+            assert patterns[syndrome] == -1 # Every one is different
+            patterns[syndrome] = sum(1<<bit for bit in bits)
+            counts[syndrome] = count
+    return patterns, counts
+
+# Which bits to flip to fix each syndrome, for every error of up to 2 bits,
+# and how many bits that is
+ERROR_PATTERNS, ERROR_COUNTS = _error_patterns()
+
+# The same goes for the message that comes out of the division, so both can be
+# worked out a byte at a time instead of a bit at a time: TABLES[k][byte] is
+# the answer for 'byte' being the k'th byte of the codeword (and everything
+# else 0), and the answer for a whole codeword is the XOR of its 4 bytes'.
+def _byte_tables(part):
+    return np.array([[cyclic_divide(byte << 8*k)[part] for byte in range(256)]
+                     for k in range(4)], dtype=np.uint32)
+
+MESSAGE_TABLES = _byte_tables(0)
+SYNDROME_TABLES = _byte_tables(1)
+
+def _lookup(tables, codewords):
+    return (tables[0][codewords & 0xFF] ^ tables[1][codewords >> 8 & 0xFF] ^
+            tables[2][codewords >> 16 & 0xFF] ^ tables[3][codewords >> 24 & 0x7F])
+
+def cyclic_correct(codewords):
+    """
+    Decode an array of 31-bit 'codewords', fixing up to 2 bit errors in each,
+    returning two arrays: the 21-bit messages, and how many bits were fixed in
+    each (-1 where there were too many errors to fix)
+    """
+    codewords = np.asarray(codewords, dtype=np.uint32)
+    syndromes = _lookup(SYNDROME_TABLES, codewords)
+
+    fixes = ERROR_PATTERNS[syndromes]
+    corrected = codewords ^ np.maximum(fixes, 0).astype(np.uint32)
+    return _lookup(MESSAGE_TABLES, corrected), ERROR_COUNTS[syndromes]
+
+# This deinterleaves the 124-bit block into 4x 31-bit (the deinterleaved
+# block is just the 4 codewords one after another)
+def deinterleave(x):
+    x = FEC_INTERLEAVER.deinterleave(x)
+    return (x >> 93, x >> 62 & 0x7FFFFFFF, x >> 31 & 0x7FFFFFFF, x & 0x7FFFFFFF)
+
+def full_correct(x):
+    """
+    Decode the 124-bit FEC block 'x', fixing up to 2 bit errors in each of its
+    codewords, and returning the 84-bit message and how many bits were fixed
+    (blowing up if there were too many errors to fix)
+    """
+    messages, corrected = cyclic_correct(deinterleave(x))
+    assert (corrected >= 0).all() # Ensure all of the errors could be fixed
+
+    a, b, c, d = [int(message) for message in messages]
+    return a << 63 | b << 42 | c << 21 | d, int(corrected.sum())
+
+# What full_decode_many() has to say about each block
+DECODE_OK = 0        # No bit errors
+DECODE_CORRECTED = 1 # Some bit errors, all fixed
+DECODE_FAILED = 2    # Too many bit errors to fix
+
+def fec_bytes(fec):
+    """
+    Turn an array of 124-bit FEC blocks into an (N, 16) uint8 array of their
+    bytes, most significant first
+
+    'fec' can already be that, or it can be an (N, 2) uint64 array holding the
+    top 60 bits and the bottom 64 bits of each block.
+    """
+    fec = np.asarray(fec)
+    if fec.dtype == np.uint8:
+        return fec.reshape(-1, 16)
+
+    words = fec.reshape(-1, 2).astype('>u8')
+    return words.view(np.uint8).reshape(-1, 16)
+
+def full_decode_many(fec):
+    """
+    Decode a whole array of 124-bit FEC blocks 'fec' (see fec_bytes() for the
+    layout) at once, fixing up to 2 bit errors in each codeword
+
+    Returns two arrays: the 84-bit messages, laid out the same way as 'fec'
+    ((N, 11) uint8 or (N, 2) uint64; see crc.message_bytes()), and a DECODE_*
+    status for each. Nothing blows up on a block with too many errors; it's
+    just marked DECODE_FAILED (and its message is garbage).
+    """
+    blocks = fec_bytes(fec)
+
+    # Deinterleaved, each block is its 4 codewords back to back; split those
+    # out of its top and bottom 64 bits
+    words = np.ascontiguousarray(FEC_INTERLEAVER.deinterleave_many(blocks))
+    words = words.view('>u8').astype(np.uint64)
+    top, bottom = words[:, 0], words[:, 1]
+    mask = np.uint64(0x7FFFFFFF)
+    codewords = np.stack([top >> np.uint64(29) & mask,
+                          (top << np.uint64(2) | bottom >> np.uint64(62)) & mask,
+                          bottom >> np.uint64(31) & mask,
+                          bottom & mask], axis=1)
+
+    messages, corrected = cyclic_correct(codewords)
+    status = np.where((corrected < 0).any(axis=1), DECODE_FAILED,
+                      np.where(corrected.any(axis=1), DECODE_CORRECTED,
+                               DECODE_OK)).astype(np.uint8)
+
+    # And put the 4 21-bit messages back together, as a << 63 | b << 42 |
+    # c << 21 | d
+    a, b, c, d = messages.astype(np.uint64).T
+    raw = np.stack([a >> np.uint64(1),
+                    (a << np.uint64(63)) | (b << np.uint64(42)) |
+                    (c << np.uint64(21)) | d], axis=1)
+
+    if np.asarray(fec).dtype == np.uint8:
+        raw = message_bytes(raw)
+    return raw, status
+
+def chase_candidates(codeword, reliability, flips=4, keep=4):
+    """
+    Find the codewords the 31-bit 'codeword' most likely really was, given the
+    'reliability' of each of its bits (a 31-long array, bit 0 first; bigger is
+    surer)
+
+    Every combination of the 'flips' least reliable bits is tried flipped, and
+    whatever syndrome is left after that is looked up in ERROR_PATTERNS. The
+    cost of each answer is the total reliability of all the bits it flipped;
+    up to 'keep' of the cheapest answers are returned as a list of (cost,
+    codeword) pairs, cheapest first.
+    """
+
+    # Every combination of the shakiest bits, all at once
+    shakiest = np.argsort(reliability, kind='stable')[:flips]
+    choices = (np.arange(1 << flips)[:, np.newaxis] >> np.arange(flips)) & 1
+    guesses = np.dot(choices, np.int64(1) << shakiest)
+    syndromes = (_lookup(SYNDROME_TABLES, codeword) ^
+                 np.bitwise_xor.reduce(choices * BIT_SYNDROMES[shakiest], axis=1))
+
+    fixes = ERROR_PATTERNS[syndromes]
+    flipped = (guesses ^ fixes)[fixes >= 0]
+    flipped = np.unique(flipped) # Different guesses can land on the same fix
+
+    bits = (flipped[:, np.newaxis] >> np.arange(31)) & 1
+    costs = np.dot(bits, reliability)
+    best = np.argsort(costs, kind='stable')[:keep]
+    return [(costs[i], codeword ^ int(flipped[i])) for i in best]
+
+def soft_decode(fec, reliability, crc, flips=4, keep=4):
+    """
+    Decode the 124-bit 'fec' block, given the 'reliability' of each of its bits
+    (a 124-long array, bit 0 first), returning the 84-bit message (or None if
+    nothing matched the 'crc')
+
+    Each of the 4 codewords gets its own chase_candidates(); then the cheapest
+    combination of those with the right CRC wins.
+    """
+
+    # Bit 'i' of codeword 'n' (counting from the last) is bit i*4+n of 'fec'
+    codewords = deinterleave(fec)
+    candidates = [chase_candidates(codeword, reliability[3 - n::4], flips, keep)
+                  for n, codeword in enumerate(codewords)]
+    if not all(candidates):
+        return None
+
+    # The CRC is linear too: the CRC of the whole message is the XOR of the
+    # CRCs of each codeword's part of it. So rather than trying every
+    # combination one at a time, we work out each part's CRC once and check
+    # every combination at once.
+    messages = []
+    costs = crcs = 0
+    for n, choices in enumerate(candidates):
+        shape = [1, 1, 1, 1]
+        shape[n] = len(choices)
+        shift = 21*(3 - n)
+
+        messages.append([cyclic_decode(codeword) << shift for _, codeword in choices])
+        costs = costs + np.reshape([cost for cost, _ in choices], shape)
+        crcs = crcs ^ np.reshape([crc16(CRC_INTERLEAVER.interleave(message))
+                                  for message in messages[-1]], shape)
+
+    costs = np.where(crcs ^ 0xce98 == crc, costs, np.inf)
+    best = np.unravel_index(np.argmin(costs), costs.shape)
+    if costs[best] == np.inf:
+        return None
+    return sum(messages[n][i] for n, i in enumerate(best))
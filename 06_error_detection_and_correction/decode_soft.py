@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# Decode the soft bits written by chapter 5's decode_wavebird.py (--soft),
+# correcting whatever errors we can along the way (see cyclic_code.py)
+
+import os
+import sys
+import argparse
+import binascii
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '05_line_coding_and_framing'))
+from bit_slicing import read_soft
+from frame_fields import check_frames, split_frames
+from cyclic_code import (full_correct, full_decode_many, soft_decode,
+                        DECODE_CORRECTED, DECODE_FAILED)
+from crc import check_crcs
+
+parser = argparse.ArgumentParser(description='Error-correct WaveBird frames using soft bits')
+parser.add_argument('soft_file', help='Soft bits written by decode_wavebird.py --soft')
+parser.add_argument('--flips', type=int, default=4,
+                    help='How many of the least reliable bits in each codeword to try flipping (default: 4)')
+args = parser.parse_args()
+
+# Every frame's first 200 soft bits, in one array; the hard bits are just the
+# signs of those
+frames = [soft[:200] for soft in read_soft(args.soft_file) if len(soft) >= 200]
+soft = np.array(frames, dtype=np.int8).reshape(-1, 200)
+packed = np.packbits(soft > 0, axis=1)
+
+# Check preamble/sync and footer
+framed = check_frames(packed)
+soft, packed = soft[framed], packed[framed]
+
+# Extract the "fec" and crc parts, and fix up to 2 bit errors per codeword
+# with the hard bits alone, for all of the frames at once (see cyclic_code.py
+# and crc.py)
+fec, crcs = split_frames(packed)
+raws, status = full_decode_many(fec)
+good = (status != DECODE_FAILED) & check_crcs(raws, crcs)
+
+clean = fixed = fixed_bits = soft_fixed = failed = 0
+for frame, block, crc, raw, result, ok in zip(soft, fec, crcs, raws, status, good):
+    block = int(binascii.hexlify(block.tobytes()), 16)
+
+    if ok:
+        raw = int(binascii.hexlify(raw.tobytes()), 16)
+        if result == DECODE_CORRECTED:
+            fixed += 1
+            fixed_bits += full_correct(block)[1]
+        else:
+            clean += 1
+    else:
+        # ...and if that's not enough, try again using the soft bits. Bit 'i'
+        # of the fec part was soft bit 171-i (the soft bits are in the order
+        # they were sent, MSB first)
+        reliability = np.abs(frame[48:172][::-1].astype(int))
+        raw = soft_decode(block, reliability, int(crc), args.flips)
+        if raw is None:
+            failed += 1
+            continue
+        soft_fixed += 1
+
+    print('%021x' % raw)
+
+print('-'*79)
+print('%d clean, %d corrected (%d bits), %d corrected with soft bits, %d failed' %
+      (clean, fixed, fixed_bits, soft_fixed, failed))
@@ -1,81 +1,61 @@
 #!/usr/bin/env python
 
-import re
-import bz2
-
-REGEX = re.compile(r'^[01]{200}$')
-
-# Functions copied from analyze_buttons.py:
-def cyclic_decode(x):
-    g = 0b11101101001
-
-    msg = 0
-    for i in range(21):
-        msg = msg << 1
-        if x&1:
-            x ^= g
-            msg |= 1
-        x = x >> 1
-
-    assert x == 0 # Ensure everything got cleared (i.e. no bit errors)
-
-    return msg
-
-def deinterleave(x):
-    a = b = c = d = 0
-
-    for i in range(124):
-        d |= (x & 1) << (i//4)
-        x = x >> 1
-        a, b, c, d = d, a, b, c
-
-    return (a, b, c, d)
-
-def full_decode(x):
-    a, b, c, d = deinterleave(x)
-
-    return (cyclic_decode(a) << 63 |
-            cyclic_decode(b) << 42 |
-            cyclic_decode(c) << 21 | 
-            cyclic_decode(d))
+import os
+import sys
+import binascii
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '05_line_coding_and_framing'))
+from frame_records import is_frame_file, read_frames, frame_ints
+from frame_fields import pack_frames, check_frames, split_frames
+from cyclic_code import full_decode_many, DECODE_OK
+from log_ingest import read_log
+
+# Either the text output of decode_wavebird.py (bz2'd), or a file of binary
+# records from its --frames (see frame_records.py)
+LOG = sys.argv[1] if len(sys.argv) > 1 else 'button_mashing.log.bz2'
+
+def log_frames(filename):
+    """
+    Count every 200-bit frame in the log 'filename', returning a Counter of
+    their values (as ints)
+    """
+    if is_frame_file(filename):
+        # Nothing to parse here, just unpack them
+        header, records = read_frames(filename)
+        return collections.Counter(frame_ints(records))
+
+    # Decompressed on every core, and only parsing each different line once
+    # (see log_ingest.py)
+    return read_log(filename)
+
+# Every different frame in the log, packed into bytes, all at once
+frames = pack_frames(log_frames(LOG))
+
+# Check preamble/sync and footer
+frames = frames[check_frames(frames)]
+
+# Extract the "fec" and crc parts, and decode them all (see cyclic_code.py)
+fec, crcs = split_frames(frames)
+raws, status = full_decode_many(fec)
+
+# Bit error detected? Just move along... (Even the ones that could be fixed:
+# we want to be sure of every message we use.)
+raws = raws[status == DECODE_OK]
+crcs = crcs[status == DECODE_OK]
 
 messages = {}
-with bz2.BZ2File('button_mashing.log.bz2', 'r') as logfile:
-    for line in logfile:
-        # Strip off extra newline or space characters that may be in the log
-        line = line.strip()
-
-        # Only match 200-bit binary lines
-        if not REGEX.match(line): continue
-
-        # Parse binary to int
-        msg = int(line, 2)
-
-        # Check preamble/sync
-        if (msg >> 152) != 0xfaaaaaaa1234: continue
-
-        # Check footer
-        if (msg & 0xFFF) != 0x110: continue
-
-        # Extract just "fec" part
-        fec = (msg >> 28) & ((1 << 124) - 1)
-
-        # Decode it
-        try:
-            raw = full_decode(fec)
-        except AssertionError:
-            # Bit error detected! Just move along...
-            continue
-
-        # Extract the crc
-        crc = (msg >> 12) & 0xFFFF
+for raw, crc in zip(raws, crcs):
+    raw = int(binascii.hexlify(raw.tobytes()), 16)
+    crc = int(crc)
 
-        #raw = sum(((raw>>i)&1)<<(4*(i%21)+i//21) for i in range(84))
+    #raw = sum(((raw>>i)&1)<<(4*(i%21)+i//21) for i in range(84))
 
-        # Record it in the set of messages
-        # First make sure we aren't overwriting a differing CRC
-        assert messages.get(raw, crc) == crc
-        messages[raw] = crc
+    # Record it in the set of messages
+    # First make sure we aren't overwriting a differing CRC
+    assert messages.get(raw, crc) == crc
+    messages[raw] = crc
 
 # This prints a few of the raw/crcs, if enabled:
 #for raw,crc in list(messages.items())[:3]:
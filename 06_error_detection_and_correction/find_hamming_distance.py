@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 
-import re
-import bz2
+import os
+import sys
+import binascii
 import collections
 
 def hamming_distance(a,b):
@@ -19,31 +20,46 @@ def hamming_distance(a,b):
 
     return d
 
-REGEX = re.compile(r'^[01]{200}$')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '05_line_coding_and_framing'))
+from frame_records import is_frame_file, read_frames, frame_ints
+from frame_fields import pack_frames, check_frames, split_frames
+from log_ingest import read_log
 
-counter = collections.Counter()
-with bz2.BZ2File('button_mashing.log.bz2', 'r') as logfile:
-    for line in logfile:
-        # Strip off extra newline or space characters that may be in the log
-        line = line.strip()
+# Either the text output of decode_wavebird.py (bz2'd), or a file of binary
+# records from its --frames (see frame_records.py)
+LOG = sys.argv[1] if len(sys.argv) > 1 else 'button_mashing.log.bz2'
 
-        # Only match 200-bit binary lines
-        if not REGEX.match(line): continue
+def log_frames(filename):
+    """
+    Count every 200-bit frame in the log 'filename', returning a Counter of
+    their values (as ints)
+    """
+    if is_frame_file(filename):
+        # Nothing to parse here, just unpack them
+        header, records = read_frames(filename)
+        return collections.Counter(frame_ints(records))
 
-        # Parse binary to int
-        msg = int(line, 2)
+    # Decompressed on every core, and only parsing each different line once
+    # (see log_ingest.py)
+    return read_log(filename)
 
-        # Check preamble/sync
-        if (msg >> 152) != 0xfaaaaaaa1234: continue
+# Every different frame in the log, packed into bytes, all at once
+counted = log_frames(LOG)
+frames = pack_frames(counted)
+counts = list(counted.values())
 
-        # Check footer
-        if (msg & 0xFFF) != 0x110: continue
+# Check preamble/sync and footer
+framed = check_frames(frames)
 
-        # Extract just the "fec" part
-        fec = (msg >> 28) & ((1 << 124) - 1)
+# Extract just the "fec" part
+fec = split_frames(frames)[0]
 
-        # Record it in the counter
-        counter.update([fec])
+# Record it in the counter
+counter = collections.Counter()
+for block, count, ok in zip(fec, counts, framed):
+    if ok:
+        counter[int(binascii.hexlify(block.tobytes()), 16)] += count
 
 # We want to eliminate any messages containing errors, but how do we do that
 # without knowing the code? An easy heuristic is to accept anything that occurs
@@ -0,0 +1,56 @@
+# Checking frames and pulling the FEC block and CRC out of them, a whole array
+# of frames at once.
+#
+# The analysis scripts used to take every frame apart one at a time, as a
+# Python int: shift it right, mask off the bits they wanted, and do it all
+# over again for the next frame. Instead, the frames can be kept as an (N, 25)
+# uint8 array of their bytes (first one sent first), and every field checked
+# or cut out of all of them in one go with a few numpy slices and shifts.
+
+import binascii
+import numpy as np
+
+FRAME_BITS = 200
+FRAME_BYTES = FRAME_BITS // 8
+
+def pack_frames(values):
+    """
+    Turn 200-bit frames given as ints (like the ones chapter 5's
+    frame_records.frame_ints() gives) into an (N, 25) uint8 array of their
+    bytes, first one sent first
+    """
+    packed = b''.join(binascii.unhexlify('%050x' % value) for value in values)
+    return np.frombuffer(packed, dtype=np.uint8).reshape(-1, FRAME_BYTES)
+
+# Where things are in a 200-bit frame (see chapter 7), counting bytes from the
+# first one sent: the 48-bit preamble and sync word fill bytes 0-5, the 124-bit
+# FEC block takes up the next 15 and a half, then the 16-bit CRC, and the
+# 12-bit footer is the last byte and a half.
+PREAMBLE_BYTES = np.frombuffer(b'\xfa\xaa\xaa\xaa\x12\x34', dtype=np.uint8)
+
+def check_frames(frames):
+    """
+    Check which of an (N, 25) uint8 array of packed 'frames' have the right
+    preamble/sync (0xfaaaaaaa1234) and footer (0x110), returning an array of
+    True/False
+    """
+    frames = np.asarray(frames, dtype=np.uint8).reshape(-1, FRAME_BYTES)
+    return ((frames[:, :6] == PREAMBLE_BYTES).all(axis=1) &
+            (frames[:, 23] & 0x0F == 0x01) & (frames[:, 24] == 0x10))
+
+def split_frames(frames):
+    """
+    Pull the FEC blocks and CRCs out of an (N, 25) uint8 array of packed
+    'frames', returning an (N, 16) uint8 array of FEC bytes (most significant
+    first, see cyclic_code.fec_bytes()) and a uint16 array of CRCs
+    """
+    frames = np.asarray(frames, dtype=np.uint8).reshape(-1, FRAME_BYTES)
+
+    # The FEC block starts half a byte in, so each byte of it is half of one
+    # byte of the frame and half of the next
+    fec = (frames[:, 5:21] << 4) | (frames[:, 6:22] >> 4)
+    fec[:, 0] &= 0x0F
+
+    crcs = ((frames[:, 21].astype(np.uint16) & 0x0F) << 12 |
+            frames[:, 22].astype(np.uint16) << 4 | frames[:, 23] >> 4)
+    return fec, crcs.astype(np.uint16)
@@ -1,33 +1,14 @@
 #!/usr/bin/env python
 
 import argparse
+import numpy as np
 
-def crc16(n):
-    """
-    Compute CRC-CCITT on the bits of integer 'n'
-
-    This implementation uses a continuously-running shift register going in
-    reverse to work on the bits in lowest-first order!
-    """
-
-    g = 0x1021 # Polynomial
-
-    crc = 0
-    r = g # Shift register seeded with polynomial
-
-    while n:
-        if n&1:
-            crc ^= r
-
-        n >>= 1
+# crc16() used to be a bit-at-a-time shift register right here; crc.py has a
+# (much faster) table-driven version that gives the same answers
+from crc import crc16
+from interleaving import Interleaver
 
-        # Perform a shift-xor operation on 'r'
-        r <<= 1
-        if r&0x10000:
-            r ^= g
-            r &= 0xFFFF
-
-    return crc
+_INTERLEAVERS = {}
 
 def interleave(n, b):
     """
@@ -35,29 +16,15 @@ def interleave(n, b):
 
     The interleaving scheme is essentially this: write the bits of 'n' into a
     b/4-wide, 4-high matrix (in left-right, top-bottom order), then transpose
-    the matrix, then read the bits back out in the same order
+    the matrix, then read the bits back out in the same order (see
+    interleaving.py, which does that a byte at a time)
     """
 
-    assert n.bit_length() <= b
-
-    out = 0
-    for i in range(b):
-        x = (n>>i) & 1 # x = 'i'th bit of 'n'
-
-        row, col = divmod(i, b//4)
-        j = col*4 + row # j = where 'i' gets interleaved to
-
-        if x:
-            out |= 1<<j
+    if b not in _INTERLEAVERS:
+        _INTERLEAVERS[b] = Interleaver(b)
+    return _INTERLEAVERS[b].interleave(n)
 
-    return out
-
-def cyclic_encode(x):
-    """
-    Encode a 21-bit value into a 31-bit cyclic-encoded codeword.
-
-    This scheme is essentially what POCSAG uses.
-    """
+def _cyclic_encode_bitwise(x):
     g = 0b11101101001
 
     codeword = 0
@@ -71,6 +38,35 @@ def cyclic_encode(x):
 
     return codeword
 
+# The code is linear, so the codeword for any 21-bit value is the XOR of the
+# codewords for each of its 7-bit slices on their own. ENCODE_TABLES[k][v] is
+# the codeword for 'v' being slice 'k' (bits 7k to 7k+6).
+ENCODE_TABLES = [[_cyclic_encode_bitwise(v << 7*k) for v in range(128)]
+                 for k in range(3)]
+ENCODE_ARRAYS = np.array(ENCODE_TABLES, dtype=np.uint32) # For numpy
+
+def cyclic_encode(x):
+    """
+    Encode a 21-bit value into a 31-bit cyclic-encoded codeword.
+
+    This scheme is essentially what POCSAG uses. Rather than shifting and
+    XORing the generator polynomial in once for every bit, the codeword is
+    looked up 7 bits at a time (see ENCODE_TABLES).
+    """
+    return (ENCODE_TABLES[0][x & 0x7F] ^
+            ENCODE_TABLES[1][x >> 7 & 0x7F] ^
+            ENCODE_TABLES[2][x >> 14 & 0x7F])
+
+def cyclic_encode_many(x):
+    """
+    Encode an array of 21-bit values 'x' at once, returning a uint32 array of
+    their 31-bit codewords
+    """
+    x = np.asarray(x, dtype=np.uint32)
+    return (ENCODE_ARRAYS[0][x & 0x7F] ^
+            ENCODE_ARRAYS[1][x >> 7 & 0x7F] ^
+            ENCODE_ARRAYS[2][x >> 14 & 0x7F])
+
 def fec_encode(x):
     """
     Encode 84-bit value 'x' using 4 cyclic_encodes, then interleave
@@ -0,0 +1,109 @@
+# Interleaving, a byte at a time (or a whole array at a time).
+#
+# The WaveBird interleaves twice: the 84-bit message before taking its CRC (as
+# a 21-wide, 4-high matrix), and the 124-bit FEC block before sending it (as
+# 4 codewords of 31 bits). Either way, it's the same thing: write the bits into
+# a matrix one row at a time, and read them back out one column at a time.
+# Every bit always ends up in the same place, so the whole thing is just a
+# fixed shuffle of the bits (a "permutation").
+#
+# Moving the bits one at a time, like generate_message.py and
+# analyze_buttons.py used to, takes a trip around a Python loop per bit.
+# Instead, we can work out ahead of time where all 8 bits of each byte end up,
+# for every possible value of that byte, and then just OR those together. For
+# a numpy array of many values at once, we unpack them into one big array of
+# bits, shuffle its columns, and pack it back up.
+
+import numpy as np
+
+class Interleaver(object):
+    """
+    The WaveBird interleave for 'bits'-bit values: bit 'i' goes to bit
+    (i % (bits/4))*4 + i/(bits/4)
+
+    Values can be interleaved or deinterleaved either one at a time (as Python
+    ints), or as an (N, bytes) uint8 array of their bytes, most significant
+    first (where 'bytes' is however many it takes to hold 'bits' bits).
+    """
+
+    def __init__(self, bits):
+        assert bits % 4 == 0
+        self.bits = bits
+        self.bytes = (bits + 7)//8
+
+        self.permutation = [i % (bits//4) * 4 + i // (bits//4) for i in range(bits)]
+        self.inverse = [0] * bits
+        for i, j in enumerate(self.permutation):
+            self.inverse[j] = i
+
+        self.interleave_tables = self._byte_tables(self.permutation)
+        self.deinterleave_tables = self._byte_tables(self.inverse)
+
+        # For arrays: which column of the unpacked bits each column of the
+        # result comes from. (np.unpackbits() puts the most significant bit
+        # first, so bit 'i' is column 'columns - 1 - i'.)
+        columns = 8*self.bytes
+        self.interleave_columns = self._columns(self.inverse, columns)
+        self.deinterleave_columns = self._columns(self.permutation, columns)
+
+    def _byte_tables(self, permutation):
+        # tables[k][byte] is where the bits of 'byte' end up, as byte 'k'
+        # (counting from the least significant)
+        tables = []
+        for k in range(self.bytes):
+            table = [0] * 256
+            for byte in range(1, 256):
+                lowest = byte & -byte
+                bit = 8*k + lowest.bit_length() - 1
+                moved = 1 << permutation[bit] if bit < self.bits else 0
+                table[byte] = table[byte & (byte - 1)] | moved
+            tables.append(table)
+        return tables
+
+    def _columns(self, source, columns):
+        # Column 'columns - 1 - j' of the result is bit source[j] of the input
+        indices = np.arange(columns)
+        for j in range(self.bits):
+            indices[columns - 1 - j] = columns - 1 - source[j]
+        return indices
+
+    def _apply(self, tables, n):
+        out = 0
+        for table in tables:
+            if not n:
+                break
+            out |= table[n & 0xFF]
+            n >>= 8
+        return out
+
+    def interleave(self, n):
+        """
+        Interleave the integer 'n'
+        """
+        assert n.bit_length() <= self.bits
+        return self._apply(self.interleave_tables, n)
+
+    def deinterleave(self, n):
+        """
+        Undo interleave() on the integer 'n'
+        """
+        assert n.bit_length() <= self.bits
+        return self._apply(self.deinterleave_tables, n)
+
+    def interleave_many(self, values):
+        """
+        Interleave an (N, bytes) uint8 array of values at once
+        """
+        bits = np.unpackbits(np.asarray(values, dtype=np.uint8), axis=1)
+        return np.packbits(bits[:, self.interleave_columns], axis=1)
+
+    def deinterleave_many(self, values):
+        """
+        Undo interleave_many()
+        """
+        bits = np.unpackbits(np.asarray(values, dtype=np.uint8), axis=1)
+        return np.packbits(bits[:, self.deinterleave_columns], axis=1)
+
+# The two layouts the WaveBird uses
+CRC_INTERLEAVER = Interleaver(84)
+FEC_INTERLEAVER = Interleaver(124)
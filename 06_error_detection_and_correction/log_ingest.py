@@ -0,0 +1,282 @@
+# Reading big bz2'd logs of frames, using every core.
+#
+# find_crc_messages.py and find_hamming_distance.py both start by reading
+# button_mashing.log.bz2 (the output of chapter 5's decode_wavebird.py) one
+# line at a time. That's fine for the log that comes with this chapter, but a
+# long session of button-mashing runs to gigabytes, and bz2 decompression is
+# slow: at a few tens of MB/s on one core, most of the time goes there.
+#
+# bz2 doesn't compress a file as one piece, though. It splits it into blocks
+# (of up to 900kB), and compresses every block on its own. Each one starts
+# with the same 48-bit "magic number" (0x314159265359, the digits of pi), and
+# the end of the whole stream is marked by another (0x177245385090, the
+# digits of the square root of pi). So we can find where every block starts,
+# wrap each one up as a little bz2 file of its own, and decompress them all at
+# the same time in separate processes.
+#
+# The catch is that bz2 doesn't bother lining blocks up with bytes: a block can
+# start at any bit. So the magic numbers have to be looked for at all 8 bit
+# offsets, and every block has to be shifted back into line before it can be
+# decompressed.
+#
+# Once it's decompressed, a block is mostly just 200-character lines, one after
+# another. Rather than matching and parsing those one at a time, numpy can
+# check and pack all of them at once (see parse_lines()), which is quick enough
+# that the decompression is all that's left to wait for.
+
+import os
+import bz2
+import mmap
+import binascii
+import collections
+import multiprocessing
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from frame_fields import check_frames
+
+def _to_int(data):
+    return int(binascii.hexlify(data), 16) if data else 0
+
+def _to_bytes(n, length):
+    return binascii.unhexlify('%0*x' % (2*length, n))
+
+BLOCK_MAGIC = 0x314159265359
+END_MAGIC = 0x177245385090
+
+FRAME_LENGTH = 200
+
+def _find_magic(data, magic):
+    """
+    Find every place the 48-bit 'magic' appears in 'data', at any bit offset,
+    returning a list of bit offsets (counting from the most significant bit of
+    the first byte)
+    """
+    found = []
+    for shift in range(8):
+        # Shifted 'shift' bits into a byte, the magic number covers 'length'
+        # bytes. The ones in the middle are exactly known, so we search for
+        # those, and then check the bits of the ones on the ends.
+        length = (shift + 48 + 7)//8
+        pad = 8*length - 48 - shift
+        pattern = _to_bytes(magic << pad, length)
+        first_mask = 0xFF >> shift
+        last_mask = (0xFF << pad) & 0xFF
+
+        middle = pattern[1:-1]
+        position = data.find(middle, 1)
+        while position != -1:
+            start = position - 1
+            end = start + length
+            if (end <= len(data) and
+                ord(data[start:start + 1]) & first_mask == ord(pattern[:1]) and
+                ord(data[end - 1:end]) & last_mask == ord(pattern[-1:])):
+                found.append(8*start + shift)
+            position = data.find(middle, position + 1)
+    return sorted(found)
+
+def find_blocks(data):
+    """
+    Find all of the compressed blocks in the bz2 data 'data', returning a list
+    of (start, stop) bit offsets
+    """
+    starts = _find_magic(data, BLOCK_MAGIC)
+    ends = _find_magic(data, END_MAGIC)
+
+    # Every block runs until the next one starts, or its stream ends
+    markers = sorted(starts + ends)
+    stops = dict(zip(markers, markers[1:]))
+    return [(start, stops[start]) for start in starts if start in stops]
+
+def _block_stream(data, start, stop):
+    """
+    Turn the block at bits 'start' to 'stop' of 'data' into a whole bz2 stream
+    on its own
+    """
+    first = start//8
+    last = (stop + 7)//8
+    bits = _to_int(data[first:last])
+
+    # Just the block, lined up with the start of a byte...
+    length = stop - start
+    block = (bits >> (8*last - stop)) & ((1 << length) - 1)
+
+    # ...then the end of the stream: for a stream of one block, the CRC of the
+    # whole stream is just the block's CRC (the 32 bits after its magic)
+    block_crc = (block >> (length - 80)) & 0xFFFFFFFF
+    stream = (block << 80) | (END_MAGIC << 32) | block_crc
+    length += 80
+
+    # ...padded out to a whole number of bytes, with a header in front (always
+    # level 9: it only says how big a block might be, and 9 covers them all)
+    pad = -length % 8
+    return b'BZh9' + _to_bytes(stream << pad, (length + pad)//8)
+
+def is_frame_line(line):
+    """
+    Check whether 'line' (bytes, with any spaces stripped off) is 200 0's and
+    1's
+    """
+    return len(line) == FRAME_LENGTH and not line.translate(None, b'01')
+
+def parse_lines(text):
+    """
+    Parse every 200-bit frame out of 'text' (bytes, one frame per line) at
+    once, returning an (N, 25) uint8 array of the packed frames (first bit
+    sent in the top bit of the first byte), and an array of True/False for
+    whether each one has the WaveBird's preamble/sync and footer
+
+    Lines that aren't exactly 200 0's and 1's are left out (after stripping
+    any spaces off the ends, the same as the analysis scripts always have).
+    """
+    data = np.frombuffer(text, dtype=np.uint8)
+
+    # Every line ends at a newline, or the end of the text
+    ends = np.append(np.flatnonzero(data == ord('\n')), len(data))
+    starts = np.append(0, ends[:-1] + 1)
+    lengths = ends - starts
+
+    # Nearly every line is exactly the right length; those get checked and
+    # packed all together. A '0' is 0 and a '1' is 1 once '0' is taken off,
+    # and anything else comes out bigger (even what's below '0', which wraps
+    # around).
+    rows = starts[lengths == FRAME_LENGTH]
+    if len(rows):
+        # (every 200 bytes in a row in the text, without copying anything,
+        # so picking out the lines is just copying the ones we want)
+        windows = as_strided(data, shape=(len(data) - FRAME_LENGTH + 1,
+                                          FRAME_LENGTH), strides=(1, 1))
+        bits = windows[rows] - ord('0')
+        bits = bits[(bits <= 1).all(axis=1)]
+    else:
+        bits = np.zeros((0, FRAME_LENGTH), dtype=np.uint8)
+
+    # The odd longer one might still be a frame with spaces around it
+    extra = [line for line in (text[start:end].strip() for start, end
+                               in zip(starts[lengths > FRAME_LENGTH],
+                                      ends[lengths > FRAME_LENGTH]))
+             if is_frame_line(line)]
+    if extra:
+        extra = np.frombuffer(b''.join(extra), dtype=np.uint8) - ord('0')
+        bits = np.concatenate([bits, extra.reshape(-1, FRAME_LENGTH)])
+
+    # Pack them, and check preamble/sync and footer for all of them at once
+    # (see frame_fields.py)
+    frames = np.packbits(bits, axis=1).reshape(-1, FRAME_LENGTH//8)
+    return frames, check_frames(frames)
+
+def count_lines(text):
+    """
+    Count the WaveBird frames in 'text' (bytes, one frame per line), returning
+    a Counter of their 200-bit values (as ints)
+    """
+    frames, framed = parse_lines(text)
+
+    # Only each different frame needs turning into an int. (Looked at as one
+    # 25-byte blob each, rather than 25 separate bytes, they sort much faster.)
+    frames = np.ascontiguousarray(frames[framed]).view('V%d' % frames.shape[1])
+    unique, first, counts = np.unique(frames.ravel(), return_index=True,
+                                      return_counts=True)
+
+    # ...kept in the order they first showed up in, like reading line by line
+    counted = collections.Counter()
+    for i in np.argsort(first, kind='stable'):
+        counted[_to_int(unique[i].tobytes())] = int(counts[i])
+    return counted
+
+def _split_lines(text):
+    """
+    Split 'text' into the end of a line that started before it, the Counter of
+    complete frames in the middle, and the start of a line that carries on
+    after it (or None if there isn't a single newline in 'text')
+    """
+    first = text.find(b'\n')
+    if first == -1:
+        return text, collections.Counter(), None
+    last = text.rfind(b'\n')
+    return (text[:first], count_lines(text[first + 1:last]),
+            text[last + 1:])
+
+def _read_block(job):
+    # Runs in a worker process: decompress and count one block
+    filename, start, stop = job
+    with open(filename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            stream = _block_stream(data, start, stop)
+        finally:
+            data.close()
+    return _split_lines(bz2.decompress(stream))
+
+def _join_blocks(pieces):
+    """
+    Put together the results of _split_lines() for each piece of a file in
+    order, counting the lines that were split between them too
+    """
+    frames = collections.Counter()
+    carry = b''
+    for head, counted, tail in pieces:
+        if tail is None:
+            carry += head
+            continue
+        frames.update(count_lines(carry + head))
+        frames.update(counted)
+        carry = tail
+    frames.update(count_lines(carry))
+    return frames
+
+def _read_sequential(filename, chunk_size=1<<24):
+    # The plain way: one core, one chunk at a time
+    def pieces():
+        with bz2.BZ2File(filename, 'r') as logfile:
+            while True:
+                text = logfile.read(chunk_size)
+                if not text:
+                    break
+                yield _split_lines(text)
+    return _join_blocks(pieces())
+
+def _pool(processes):
+    # Forking is the only way to start workers that doesn't run the script
+    # that's using us all over again in each one (which neither of the
+    # analysis scripts is set up for)
+    if hasattr(multiprocessing, 'get_context'):
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('fork').Pool(processes)
+        return None
+    return multiprocessing.Pool(processes)
+
+def read_log(filename, processes=None):
+    """
+    Read a bz2'd log of decode_wavebird.py's output, returning a Counter of
+    how many times each 200-bit WaveBird frame (as an int) appears in it
+
+    The blocks are decompressed in parallel, using 'processes' worker
+    processes (default: one per core). If anything goes wrong with that (if a
+    block can't be decompressed, or something that isn't a block happened to
+    look like one), the whole file is read again the ordinary way.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    if processes < 2 or not os.path.getsize(filename):
+        return _read_sequential(filename)
+
+    with open(filename, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            blocks = find_blocks(data)
+        finally:
+            data.close()
+
+    if len(blocks) < 2:
+        return _read_sequential(filename)
+
+    pool = _pool(processes)
+    if pool is None:
+        return _read_sequential(filename)
+    try:
+        jobs = [(filename, start, stop) for start, stop in blocks]
+        return _join_blocks(pool.imap(_read_block, jobs))
+    except (IOError, EOFError, ValueError):
+        return _read_sequential(filename)
+    finally:
+        pool.terminate()
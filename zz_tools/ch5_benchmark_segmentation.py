@@ -0,0 +1,54 @@
+#!/usr/bin/env python2
+
+# Compares the old itertools.groupby() burst segmentation loop against
+# burst_detection.burst_spans() on a synthetic 'is_signal' array laid out like
+# a real capture: a ~2.2ms burst every 4ms at 4 Msps, with a little chatter at
+# the edges of each burst. (burst_spans() is find_runs() and filter_runs(),
+# the same two steps BurstDetector uses on every block.)
+
+from __future__ import division, print_function
+
+import os
+import sys
+import time
+import itertools
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '05_line_coding_and_framing'))
+from burst_detection import burst_spans
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+SAMPLERATE = 4000000
+
+def groupby_spans(is_signal):
+    i = 0
+    bursts = []
+    for signal,grouper in itertools.groupby(is_signal):
+        run_length = len(list(grouper))
+        i += run_length
+
+        if signal:
+            if 8000 < run_length < 12000: # Ignore bursts of wrong length
+                bursts.append((i-run_length, i))
+    return bursts
+
+period = np.zeros(16000, dtype=bool)
+period[3000:11733] = True
+period[[2990, 2995, 11740]] = True # Noise spikes
+is_signal = np.tile(period, int(SECONDS*SAMPLERATE)//len(period))
+
+start = time.time()
+old = groupby_spans(is_signal)
+old_time = time.time() - start
+
+start = time.time()
+new = burst_spans(is_signal)
+new_time = time.time() - start
+
+assert [tuple(span) for span in new] == old
+
+print('%d samples, %d bursts' % (len(is_signal), len(new)))
+print('itertools.groupby: %8.3f ms' % (old_time*1000))
+print('burst_spans:       %8.3f ms (%.0fx faster)' % (new_time*1000,
+                                                       old_time/new_time))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# Compares the old bit-at-a-time shift register crc16() against the
+# table-driven crc.crc16() on random 84-bit WaveBird messages, and against
+# crc.wavebird_crcs() doing all of them at once, checking that they agree on
+# every one.
+
+from __future__ import division, print_function
+
+import os
+import sys
+import time
+import random
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '06_error_detection_and_correction'))
+from crc import crc16, wavebird_crcs
+from generate_message import interleave
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+def shift_register_crc16(n):
+    g = 0x1021 # Polynomial
+
+    crc = 0
+    r = g # Shift register seeded with polynomial
+
+    while n:
+        if n&1:
+            crc ^= r
+
+        n >>= 1
+
+        # Perform a shift-xor operation on 'r'
+        r <<= 1
+        if r&0x10000:
+            r ^= g
+            r &= 0xFFFF
+
+    return crc
+
+random.seed(0)
+messages = [random.getrandbits(84) for i in range(COUNT)]
+
+interleaved = [interleave(n, 84) for n in messages]
+words = np.array([(n >> 64, n & 0xFFFFFFFFFFFFFFFF) for n in messages],
+                 dtype=np.uint64)
+
+start = time.time()
+old = [shift_register_crc16(n) ^ 0xce98 for n in interleaved]
+old_time = time.time() - start
+
+start = time.time()
+new = [crc16(n) ^ 0xce98 for n in interleaved]
+new_time = time.time() - start
+
+start = time.time()
+batch = wavebird_crcs(words)
+batch_time = time.time() - start
+
+assert new == old
+assert batch.tolist() == old
+
+print('%d messages' % COUNT)
+print('shift register: %8.3f ms (%.3f us/message)' % (old_time*1000,
+                                                      old_time/COUNT*1e6))
+print('crc16 (table):  %8.3f ms (%.3f us/message, %.1fx faster)' %
+      (new_time*1000, new_time/COUNT*1e6, old_time/new_time))
+print('wavebird_crcs:  %8.3f ms (%.3f us/message, %.1fx faster)' %
+      (batch_time*1000, batch_time/COUNT*1e6, old_time/batch_time))